@@ -0,0 +1,885 @@
+#!/usr/bin/env python
+#
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys, os, getopt, time, config
+from search import *
+from parser import *
+from generator import *
+from debug import *
+
+def timed(func, repeat):
+    """
+    Run func() repeat times, return the average number of seconds per call
+    """
+
+    start = time.time()
+    for n in xrange(repeat):
+        func()
+    return (time.time() - start) / float(repeat)
+
+class NullWriter(object):
+    """
+    Swallows everything search() tries to print
+    """
+
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+def quietly(func, *args):
+    """
+    Call func(*args) with stdout sent to the bit bucket
+    """
+
+    stdout = sys.stdout
+    sys.stdout = NullWriter()
+    try:
+        return func(*args)
+    finally:
+        sys.stdout = stdout
+
+# Used when no batch file is given
+sample_queries = [
+    'grinning chinese dude',
+    'smiling asian man',
+    'attractive asian woman',
+    'a chubby guy with a double chin',
+    'neither male nor female',
+    'man or woman',
+    'not (man or woman)',
+    'a man with curly hair and no sunglasses',
+    'an old bald man wearing a hat',
+    'a girl or a boy',
+    'a candid picture of a smiling woman',
+    'a skinny woman with high cheekbones',
+    'an angry man with black hair',
+    'a woman who is not smiling',
+    'a husky man with an oval face',
+    'the man and the woman and the boy and the girl',
+    'non smiling male',
+    'a guy wearing spectacles',
+]
+
+def load_queries(batchFile):
+    """
+    Read a batch file (same format as newman.py -b), or fall back on
+    the sample queries
+    """
+
+    if batchFile is None:
+        return sample_queries
+
+    queries = []
+    fh = open(batchFile, 'r')
+    for line in fh:
+        line = line.strip()
+        if len(line) > 0:
+            queries.append(line)
+    fh.close()
+    return queries
+
+def legacy_preprocess(parts, vocabulary):
+    """
+    The old way of rewriting aliases: find the longest (rightmost) alias
+    anywhere in the phrase by scanning the whole vocabulary, replace it,
+    and start over from scratch. Kept around purely for comparison.
+    """
+
+    parts = list(parts)
+    while True:
+        found = False
+        size = len(parts)
+        while size >= 1 and not found:
+            prange = range(0, len(parts) - size + 1)
+            prange.reverse()
+            for n in prange:
+                pre = (' '.join(parts[n:size+n])).lower().rstrip(",.!\"'")
+                for vword in vocabulary:
+                    if vword.word != pre and vword.is_alias(pre):
+                        del parts[n:size+n]
+                        parts.insert(n, vword.word)
+                        found = True
+                        break
+                if found:
+                    break
+            size -= 1
+        if not found:
+            return parts
+
+def bench_preprocess(vocabulary, grammar, generator, queries, repeat):
+    """
+    Show how alias rewriting scales with the length of the query
+    """
+
+    seed = ('a chubby dude with a receding hairline , a chin count of two and ' +
+            'a black with white photo of some big boned guy').split()
+
+    print '%8s %14s %14s %14s' % ('words', 'rewrite ms', 'us/word', 'legacy ms')
+    for mult in (1, 2, 4, 8, 16, 32):
+        parts = seed * mult
+        new = timed(lambda: vocabulary.rewrite(parts), repeat)
+        if mult <= 2:
+            old = '%14.3f' % (timed(lambda: legacy_preprocess(parts, vocabulary), 1) * 1000.0)
+        else:
+            old = '%14s' % ('-')
+        print '%8d %14.3f %14.3f %s' % (len(parts), new * 1000.0, new * 1000000.0 / len(parts), old)
+
+    # Same answers as the old way: random mixes of pieces of the multi-word
+    # aliases (so they overlap every which way), and two aliases where the
+    # shorter one on the left has to lose to the longer one on the right
+    import random
+    from word import BaseWord, Vocabulary
+
+    rand = random.Random(1901)
+    pieces = []
+    for key in vocabulary._literals.keys():
+        pieces.extend(key.split())
+    pieces.extend([',', '.', 'man'])
+
+    checks = [(seed, vocabulary)]
+    for n in xrange(500):
+        checks.append(([rand.choice(pieces) for m in xrange(rand.randint(1, 8))], vocabulary))
+    overlapping = Vocabulary([BaseWord('ab', None, None, ['a b']), BaseWord('bcd', None, None, ['b c d'])])
+    checks.append(('a b c d'.split(), overlapping))
+    checks.append(('a b c d a b'.split(), overlapping))
+
+    mismatches = 0
+    for parts, vocab in checks:
+        if vocab.rewrite(parts) != legacy_preprocess(parts, vocab):
+            mismatches += 1
+            print 'MISMATCH:', ' '.join(parts)
+    print '%d mismatches against the legacy rewriting in %d phrases' % (mismatches, len(checks))
+    return mismatches
+
+def bench_parse(vocabulary, grammar, generator, queries, repeat):
+    """
+    Per-query latency of a batch run, recompiling the grammar for every
+    search (the old way) vs. reusing the compiled grammar
+    """
+
+    source = grammar.source()
+    run = lambda g: [search(q, vocabulary, g, generator) for q in queries]
+
+    # Warm up wordnet and friends so they don't pollute the first run
+    quietly(run, grammar)
+
+    old = timed(lambda: quietly(run, source), repeat)
+    new = timed(lambda: quietly(run, grammar), repeat)
+    count = float(len(queries))
+
+    print '%-28s %12s' % ('', 'ms/query')
+    print '%-28s %12.3f' % ('grammar string (recompiled)', old * 1000.0 / count)
+    print '%-28s %12.3f' % ('compiled grammar', new * 1000.0 / count)
+    print '%-28s %11.1fx' % ('speedup', old / new)
+
+def bench_ancestors(vocabulary, grammar, generator, queries, repeat):
+    """
+    Checking a few thousand nouns against every base word, by walking
+    the hypernym paths vs. using the ancestor index
+    """
+
+    from nltk.corpus import wordnet as wn
+    from word import AncestorIndex
+
+    nouns = []
+    for n, synset in enumerate(wn.all_synsets(wn.NOUN)):
+        if n % 25 == 0:
+            nouns.append(synset)
+        if len(nouns) >= 3000:
+            break
+    basewords = [b for b in vocabulary if len(b.synsets) > 0]
+
+    def check(ancestors):
+        return [[b.get_valid_synsets(s, ancestors) for b in basewords] for s in nouns]
+
+    start = time.time()
+    old = check(None)
+    old_time = time.time() - start
+
+    index = AncestorIndex(vocabulary)
+    start = time.time()
+    cold = check(index)
+    cold_time = time.time() - start
+
+    warm_time = timed(lambda: check(index), repeat)
+
+    failures = 0
+    if check(index) != old or cold != old:
+        failures += 1
+        print 'MISMATCH: the ancestor index disagrees with hypernym_paths()'
+
+    count = float(len(nouns))
+    print '%d nouns x %d base words' % (len(nouns), len(basewords))
+    print '%-28s %12s' % ('', 'us/noun')
+    print '%-28s %12.1f' % ('hypernym_paths()', old_time * 1000000.0 / count)
+    print '%-28s %12.1f' % ('ancestor index (cold)', cold_time * 1000000.0 / count)
+    print '%-28s %12.1f' % ('ancestor index (warm)', warm_time * 1000000.0 / count)
+    return failures
+
+class LegacyCollection(ClassifierCollection):
+    """
+    A ClassifierCollection which reduces symbols the old way: every window,
+    biggest first, building ProductionSymbol objects and a key for each one,
+    and starting all over again after every match
+    """
+
+    def _convert(self, n):
+        arr = self._final[n]
+        cls = self._classifiers[n]
+
+        while True:
+            ret = self._gauntlet(cls, False)
+            if ret == None:
+                if len(cls) > 0:
+                    ret = self._gauntlet(cls, True)
+                    if ret != None:
+                        for r in ret:
+                            arr.append(r)
+                        continue
+                    remaining = '"' + '", "'.join([c[0] for c in cls]) + '"'
+                    raise ParserException('Unable to meaningfully parse the production symbols: ' + remaining)
+                else:
+                    return
+            else:
+                for r in ret:
+                    arr.append(r)
+
+    def _gauntlet(self, cls, desperate):
+        size = len(cls)
+        desperate = False
+
+        while size >= 1:
+            end = len(cls) - size + 1
+            for n in range(0, end):
+                prods = [ProductionSymbol(p[0], p[1]) for p in cls[n:size+n]]
+                ret = self._generator.get_mapping(prods, desperate)
+                if ret != None:
+                    del cls[n:size+n]
+                    return ret
+            size -= 1
+            if size == 0 and desperate == False:
+                size = 1
+                desperate = True
+
+        return None
+
+def reduce_symbols(collection, symbols):
+    """
+    Feed a list of (name, negate) pairs through a ClassifierCollection,
+    returns the final results or the exception that came out
+    """
+
+    for name, negate in symbols:
+        collection.add(name, negate)
+        collection.addtext(name)
+    try:
+        collection.finish()
+    except Exception, e:
+        return (e.__class__.__name__, str(e))
+    return collection.results()
+
+def random_symbols(generator, count, rand, supported = True):
+    """
+    A random run of production symbols, mostly ones that have a mapping.
+    Unless supported is False, symbols which are flat out unsupported are
+    left out, otherwise hardly any run would make it very far.
+    """
+
+    pairs = [pair for (pair, sid) in generator._symbols.items()
+             if not supported or not isinstance(generator._mapping.get((sid,)), UnsupportedSearch)]
+    pairs.sort()
+    pairs += [('PROD_WAVY', False)]
+    return [rand.choice(pairs) for n in xrange(count)]
+
+def bench_gauntlet(vocabulary, grammar, generator, queries, repeat):
+    """
+    Reducing 10-30 production symbols to classifiers, probing every window
+    (the old way) vs. using the interned symbol index
+    """
+
+    import random
+
+    rand = random.Random(572)
+    print '%8s %14s %14s %10s' % ('symbols', 'legacy ms', 'indexed ms', 'speedup')
+    for count in (10, 20, 30):
+        runs = [random_symbols(generator, count, rand) for n in xrange(50)]
+        old = timed(lambda: [reduce_symbols(LegacyCollection(generator), r) for r in runs], repeat)
+        new = timed(lambda: [reduce_symbols(ClassifierCollection(generator), r) for r in runs], repeat)
+        print '%8d %14.3f %14.3f %9.1fx' % (count, old * 1000.0 / len(runs), new * 1000.0 / len(runs), old / new)
+
+    # Same answers (or the same errors) as the old way, every time
+    mismatches = 0
+    for n in xrange(2000):
+        run = random_symbols(generator, rand.randint(1, 30), rand, n % 4 != 0)
+        if reduce_symbols(LegacyCollection(generator), run) != reduce_symbols(ClassifierCollection(generator), run):
+            mismatches += 1
+            print 'MISMATCH:', run
+    print '%d mismatches against the legacy reduction in 2000 random runs' % (mismatches)
+    return mismatches
+
+def bench_results(vocabulary, grammar, generator, queries, repeat):
+    """
+    Per-query latency with and without the result cache, running the
+    queries over and over like a busy server would
+    """
+
+    from engine import Engine
+
+    cold = Engine(vocabulary, grammar, generator, 0)
+    warm = Engine(vocabulary, grammar, generator)
+    cold.search_many(queries)
+
+    old = timed(lambda: cold.search_many(queries), repeat)
+    new = timed(lambda: warm.search_many(queries), repeat)
+    count = float(len(queries))
+
+    failures = 0
+    if [str(r) for r in cold.search_many(queries)] != [str(r) for r in warm.search_many(queries)]:
+        failures += 1
+        print 'MISMATCH: the result cache changed the output'
+
+    print '%-28s %12s' % ('', 'ms/query')
+    print '%-28s %12.3f' % ('no result cache', old * 1000.0 / count)
+    print '%-28s %12.3f' % ('result cache', new * 1000.0 / count)
+    print '%-28s %11.1fx' % ('speedup', old / new)
+    print 'Result cache: ' + str(warm.cache())
+    return failures
+
+def bench_threads(vocabulary, grammar, generator, queries, repeat):
+    """
+    Stress test: one Engine searched from lots of threads at once (with
+    and without a reduction cache, with a result cache small enough to be
+    thrashed) has to come up with exactly what searching one query at a
+    time does. The most threads go first, while WordNet is still cold.
+    """
+
+    import random, tempfile, shutil
+    from engine import Engine
+    from cache import open_cache
+
+    rand = random.Random(1023)
+    phrases = queries + mangled_queries(queries, 20 * len(queries), rand)
+    rounds = max(1, repeat / 10)
+
+    # Switch threads as often as possible, so they trip over each other
+    interval = sys.getcheckinterval()
+    tmp = tempfile.mkdtemp(prefix = 'newman-threads-')
+    runs = []
+    try:
+        sys.setcheckinterval(1)
+        for name, path in (('no reduction cache', None), ('reduction cache', os.path.join(tmp, 'cache.db'))):
+            for threads in (64, 16, 4, 1):
+                elapsed = 0.0
+                outputs = []
+                for n in xrange(rounds):
+                    engine = Engine(vocabulary, grammar, generator, 32)
+                    vocabulary.set_cache(None)
+                    open_cache(vocabulary, path)
+                    start = time.time()
+                    results = engine.search_many(phrases, threads)
+                    elapsed += time.time() - start
+                    outputs.append([str(r) for r in results])
+                runs.append((name, threads, elapsed, outputs))
+    finally:
+        sys.setcheckinterval(interval)
+        vocabulary.set_cache(None)
+        shutil.rmtree(tmp)
+
+    expected = [str(r) for r in Engine(vocabulary, grammar, generator, 0).search_many(phrases)]
+    print '%-28s %8s %12s %12s' % ('', 'threads', 'ms/query', 'mismatches')
+    failures = 0
+    for name, threads, elapsed, outputs in runs:
+        mismatches = 0
+        for output in outputs:
+            for n in xrange(len(phrases)):
+                if output[n] != expected[n]:
+                    mismatches += 1
+                    print 'MISMATCH:', repr(phrases[n])
+        print '%-28s %8d %12.3f %12d' % (name, threads, elapsed * 1000.0 / rounds / len(phrases), mismatches)
+        failures += mismatches
+    return failures
+
+def long_queries(queries, length):
+    """
+    Glue queries together with "and" until each one is length words long
+    """
+
+    joined = []
+    for n in xrange(len(queries)):
+        words = []
+        m = n
+        while len(words) < length:
+            if len(words) > 0:
+                words.append('and')
+            words.extend(queries[m % len(queries)].split())
+            m += 1
+        joined.append(' '.join(words[:length]))
+    return joined
+
+def bench_typeahead(vocabulary, grammar, generator, queries, repeat):
+    """
+    Search-as-you-type: 20 word queries typed one keystroke at a time,
+    every keystroke searched from scratch vs. updating an engine.Session.
+    Both have to come up with the exact same results.
+    """
+
+    from engine import Engine
+
+    texts = long_queries(queries, 20)
+    rounds = max(1, repeat / 10)
+
+    # Whichever goes first shouldn't be the one paying to warm up WordNet
+    Engine(vocabulary, grammar, generator, 0).search_many([t[:end] for t in texts for end in xrange(1, len(t) + 1)])
+
+    print '%-8s %-10s %10s %10s %10s %10s %12s' % ('parser', '', 'mean ms', 'p50 ms', 'p90 ms', 'max ms',
+                                                  'mismatches')
+    failures = 0
+    for parser in PARSERS:
+        timings = {'search': [], 'session': []}
+        mismatches = 0
+        for n in xrange(rounds):
+            # Fresh result caches every round, neither one gets a head start
+            searching = Engine(vocabulary, grammar.using(parser), generator)
+            typing = Engine(vocabulary, grammar.using(parser), generator)
+            for text in texts:
+                session = typing.session()
+                for end in xrange(1, len(text) + 1):
+                    start = time.time()
+                    expected = searching.search(text[:end])
+                    timings['search'].append(time.time() - start)
+
+                    start = time.time()
+                    result = session.update(text[:end])
+                    timings['session'].append(time.time() - start)
+
+                    if str(result) != str(expected):
+                        mismatches += 1
+                        print 'MISMATCH:', repr(text[:end])
+
+        for name in ('search', 'session'):
+            values = sorted(timings[name])
+            print '%-8s %-10s %10.3f %10.3f %10.3f %10.3f %12d' % \
+                (parser, name, sum(values) * 1000.0 / len(values), values[len(values) / 2] * 1000.0,
+                 values[int(len(values) * 0.9)] * 1000.0, values[-1] * 1000.0, mismatches)
+        failures += mismatches
+    print '(%d keystrokes per round, %d rounds)' % (sum([len(t) for t in texts]), rounds)
+    return failures
+
+def bench_stream(vocabulary, grammar, generator, queries, repeat):
+    """
+    JSON lines throughput, plus a check that input which isn't UTF-8
+    still gets one record per line instead of killing the stream
+    """
+
+    import json, StringIO
+    from engine import Engine
+    from stream import read_queries, run_queries, write_records
+
+    engine = Engine(vocabulary, grammar, generator)
+    text = '\n'.join(queries * 10) + '\n'
+    def run():
+        out = StringIO.StringIO()
+        write_records(run_queries(read_queries(StringIO.StringIO(text)), engine), out)
+        return out.getvalue()
+    elapsed = timed(run, repeat)
+    print '%-24s %12.1f' % ('records/sec', len(queries) * 10 / elapsed)
+
+    failures = 0
+    lines = ['smiling man', 'caf\xe9 man', '\xff\xfe', 'smiling \xc3 woman', 'smiling woman']
+    out = StringIO.StringIO()
+    try:
+        write_records(run_queries(read_queries(StringIO.StringIO('\n'.join(lines) + '\n')), engine), out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        if [r['line'] for r in records] != range(1, len(lines) + 1):
+            failures += 1
+            print 'FAILED: expected a record for every line, got', [r['line'] for r in records]
+    except (UnicodeError, ValueError), e:
+        failures += 1
+        print 'FAILED: input that isn\'t UTF-8 broke the stream:', e.__class__.__name__, str(e)
+
+    # Even a record that already has bad bytes in it makes it out
+    out = StringIO.StringIO()
+    try:
+        write_records([{'line': 1, 'query': 'caf\xe9', 'groups': None, 'error': None}], out)
+    except UnicodeError, e:
+        failures += 1
+        print 'FAILED: a record that isn\'t UTF-8 broke the stream:', str(e)
+    print '%d failures with input that isn\'t UTF-8' % (failures)
+    return failures
+
+def reduced_queries(vocabulary, queries):
+    """
+    Run queries through preprocessing and WordNet, returns the lists of
+    reduced words that would be handed to the parser
+    """
+
+    tokenizer = NltkTokenizer()
+    reduced = []
+    for query in queries:
+        try:
+            tokens = tokenizer.tokenize(preprocess(query, vocabulary))
+            reduced.append([Word(t, vocabulary).reduced() for t in tokens])
+        except (NonWordException, UnknownWordException):
+            pass
+    return reduced
+
+def bench_chart(vocabulary, grammar, generator, queries, repeat):
+    """
+    Parsing throughput in tokens/sec, nltk's chart parser vs. the
+    compiled one, on the queries by themselves and strung together
+    """
+
+    from chart import CompiledChart
+
+    compiled = CompiledChart(grammar.cfg())
+    nltkParser = grammar._parser
+
+    def first(parts):
+        trees = nltkParser.nbest_parse(parts)
+        if len(trees) == 0:
+            return None
+        return trees[0]
+
+    def parse_all(func, sentences):
+        for parts in sentences:
+            try:
+                func(parts)
+            except ValueError:
+                pass
+
+    # nltk builds every tree before handing back the first one, so
+    # anything much longer than this takes forever (or all of memory)
+    single = reduced_queries(vocabulary, queries)
+    joined = []
+    for n in xrange(0, len(single) - 1):
+        parts = single[n] + ['or'] + single[n + 1]
+        if len(parts) <= 12:
+            joined.append(parts)
+
+    print '%-10s %8s %16s %16s %10s' % ('', 'tokens', 'nltk tok/s', 'chart tok/s', 'speedup')
+    failures = 0
+    for name, sentences in (('single', single), ('joined', joined)):
+        mismatches = 0
+        for parts in sentences:
+            try:
+                if str(first(parts)) != str(compiled.parse(parts)):
+                    mismatches += 1
+            except ValueError:
+                pass
+        if mismatches > 0:
+            print 'MISMATCH: %d different trees' % (mismatches)
+        failures += mismatches
+
+        tokens = float(sum([len(s) for s in sentences]))
+        old = timed(lambda: parse_all(first, sentences), repeat)
+        new = timed(lambda: parse_all(compiled.parse, sentences), repeat)
+        print '%-10s %8d %16.0f %16.0f %9.1fx' % (name, tokens, tokens / old, tokens / new, old / new)
+    return failures
+
+def mangled_queries(queries, count, rand):
+    """
+    Make up queries full of the things tokenizers trip over: contractions,
+    possessives, brackets, hyphens, quotes, punctuation, odd case, ...
+    """
+
+    extras = ["n't", "'s", "'S", "'", "'ll", "N'T", "'d", "-", "--", "(", ")", "[", "]", "{", "<", ">",
+              ".", "?", "!", ",", ":", '"', "''", "``", "gonna", "cannot", "'tis", "o'", "x2"]
+    words = ' '.join(queries).split()
+    mangled = []
+    for n in xrange(count):
+        parts = []
+        for m in xrange(rand.randint(1, 8)):
+            word = rand.choice(words)
+            if rand.random() < 0.3:
+                word = word.upper() if rand.random() < 0.5 else word.capitalize()
+            if rand.random() < 0.4:
+                word = word + rand.choice(extras)
+            if rand.random() < 0.2:
+                word = rand.choice(extras) + word
+            parts.append(word)
+        mangled.append(rand.choice(['', ' ', '(']) + ' '.join(parts) + rand.choice(['', ' ', ')', "'"]))
+    return mangled
+
+# Things the regex tokenizer has to get exactly like treebank does
+tricky_phrases = [
+    "a man who isn't smiling",
+    "a woman's face",
+    'the "old" man',
+    "a man, a woman. a boy!",
+    'a man (or a woman)',
+    "it's a girl?",
+    "dude... smiling",
+    "don't cannot gonna",
+    'black & white',
+    "a man -- smiling",
+    "o'neil's hat",
+    '3.5 men $10',
+]
+
+def bench_tokenize(vocabulary, grammar, generator, queries, repeat):
+    """
+    Tokenizing, punkt + treebank vs. the regex tokenizer (which has to
+    give the exact same tokens, falling back to nltk or not)
+    """
+
+    import random
+
+    nltkTokenizer = NltkTokenizer()
+    regexTokenizer = RegexTokenizer()
+    phrases = [preprocess(q, vocabulary) for q in queries]
+
+    def tokenize_all(tokenizer, phrases):
+        for phrase in phrases:
+            tokenizer.tokenize(phrase)
+
+    old = timed(lambda: tokenize_all(nltkTokenizer, phrases), repeat)
+    new = timed(lambda: tokenize_all(regexTokenizer, phrases), repeat)
+    count = float(len(phrases))
+    print '%-28s %12s' % ('', 'us/query')
+    print '%-28s %12.1f' % ('nltk', old * 1000000.0 / count)
+    print '%-28s %12.1f' % ('regex', new * 1000000.0 / count)
+    print '%-28s %11.1fx' % ('speedup', old / new)
+
+    rand = random.Random(572)
+    mismatches = 0
+    fast = 0
+    checked = phrases + tricky_phrases + mangled_queries(queries, 5000, rand)
+    for phrase in checked:
+        regexTokenizer._fallback = None
+        if regexTokenizer.tokenize(phrase) != nltkTokenizer.tokenize(phrase):
+            mismatches += 1
+            print 'MISMATCH:', repr(phrase)
+        if regexTokenizer._fallback is None:
+            fast += 1
+    print '%d mismatches in %d phrases (%d without falling back to nltk)' % (mismatches, len(checked), fast)
+    return mismatches
+
+def bench_forest(vocabulary, grammar, generator, queries, repeat):
+    """
+    Long, ambiguous queries, up to 60 tokens: the reduced queries strung
+    together with 'and' and 'or', and "black male and white female or ..."
+    (black and white are both a COLOR and a RACE). Enumerating every tree
+    like nbest_parse does vs. reading the first one off the packed forest,
+    with nltk's chart and with the compiled one.
+    """
+
+    from chart import CompiledChart
+
+    compiled = CompiledChart(grammar.cfg())
+    nltkParser = grammar._parser
+    single = [s for s in reduced_queries(vocabulary, queries) if len(s) > 0]
+    colors = ['black', 'male', 'and', 'white', 'female', 'or'] * 10
+
+    def joined(size):
+        # A few queries of about this size
+        sentences = []
+        for n in xrange(min(5, len(single))):
+            parts = list(single[n])
+            m = n
+            while len(parts) < size:
+                m += 1
+                parts += [('and', 'or')[m % 2]] + single[m % len(single)]
+            sentences.append(parts[:size])
+
+        # Some of those got cut off in the middle of something
+        parseable = []
+        for parts in sentences:
+            try:
+                if compiled.parse(parts) is not None:
+                    parseable.append(parts)
+            except ValueError:
+                pass
+        return parseable
+
+    def enumerated(parts):
+        trees = nltkParser.nbest_parse(parts)
+        if len(trees) == 0:
+            return None
+        return trees[0]
+
+    print '%-10s %6s %8s %14s %14s %14s' % ('', 'tokens', 'queries', 'nbest ms', 'forest ms', 'chart ms')
+    failures = 0
+    for name, make in (('joined', joined), ('colors', lambda size: [colors[:size - 1]])):
+        for size in (6, 12, 18, 24, 36, 48, 60):
+            sentences = make(size)
+            if len(sentences) == 0:
+                continue
+
+            count = max(1, repeat / 10)
+            total = float(len(sentences))
+            mismatches = 0
+            for parts in sentences:
+                if str(grammar.first_parse(parts)) != str(compiled.parse(parts)):
+                    mismatches += 1
+
+            # Every tree takes forever (or all of memory) past this
+            old = '-'
+            if size <= 18:
+                for parts in sentences:
+                    if str(enumerated(parts)) != str(grammar.first_parse(parts)):
+                        mismatches += 1
+                old = '%.1f' % (timed(lambda: [enumerated(p) for p in sentences], count) * 1000.0 / total)
+
+            if mismatches > 0:
+                print 'MISMATCH: %d different trees' % (mismatches)
+            failures += mismatches
+            new = timed(lambda: [grammar.first_parse(p) for p in sentences], count) * 1000.0 / total
+            fast = timed(lambda: [compiled.parse(p) for p in sentences], count) * 1000.0 / total
+            print '%-10s %6d %8d %14s %14.1f %14.1f' % (name, max([len(p) for p in sentences]), len(sentences),
+                                                           old, new, fast)
+    return failures
+
+# Runs newman.py in a fresh interpreter and reports its peak memory in
+# kB. That's VmHWM, since ru_maxrss on Linux carries the high water mark
+# of whoever forked us (i.e. this benchmark) right across the exec.
+_startup_wrapper = """
+import sys, os, resource, atexit
+def peak():
+    try:
+        for line in open('/proc/self/status'):
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+atexit.register(lambda: sys.stderr.write('maxrss %d\\n' % peak()))
+execfile(sys.argv[0], {'__name__': '__main__'})
+"""
+
+def bench_startup(vocabulary, grammar, generator, queries, repeat):
+    """
+    Wall clock time and peak memory of a whole newman.py run, for a
+    search that never leaves the vocabulary, one with a word only
+    WordNet knows, and a -l lookup
+    """
+
+    import subprocess, tempfile, shutil
+
+    newman = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'newman.py')
+    tmp = tempfile.mkdtemp(prefix = 'newman-startup-')
+    snapshot = os.path.join(tmp, 'snapshot')
+    cases = (
+        ('alias only', ['-s', 'smiling asian man']),
+        ('unknown word', ['-s', 'a grinning dude']),
+        ('lookup', ['-l', 'dude']),
+    )
+
+    def run(args):
+        proc = subprocess.Popen([sys.executable, '-c', _startup_wrapper, newman] + args,
+                                stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+        out, err = proc.communicate()
+        rss = 0
+        for line in err.split('\n'):
+            if line.startswith('maxrss '):
+                rss = int(line.split()[1])
+        return rss
+
+    count = max(1, min(repeat, 5))
+    try:
+        print '%-14s %-10s %12s %12s' % ('', '', 'ms', 'peak MB')
+        for name, args in cases:
+            for mode, extra in (('config', []), ('snapshot', ['--snapshot', snapshot])):
+                run(extra + args)
+                rss = []
+                elapsed = timed(lambda: rss.append(run(extra + args)), count)
+                print '%-14s %-10s %12.1f %12.1f' % (name, mode, elapsed * 1000.0, max(rss) / 1024.0)
+    finally:
+        shutil.rmtree(tmp)
+
+benchmarks = {
+    'preprocess': bench_preprocess,
+    'parse': bench_parse,
+    'ancestors': bench_ancestors,
+    'gauntlet': bench_gauntlet,
+    'chart': bench_chart,
+    'forest': bench_forest,
+    'startup': bench_startup,
+    'tokenize': bench_tokenize,
+    'results': bench_results,
+    'threads': bench_threads,
+    'typeahead': bench_typeahead,
+    'stream': bench_stream,
+}
+
+def usage():
+    """
+    Print out the usage for this program
+    """
+
+    print 'Usage: %s [OPTIONS] BENCHMARK...' % (os.path.basename(sys.argv[0]))
+    print '    -b FILE        Queries to use, one per line (default: built-in samples)'
+    print '    -r COUNT       Number of repetitions (default 20)'
+    print '    -h             Show this helpful message'
+    print ''
+    print 'Benchmarks: ' + ', '.join(sorted(benchmarks.keys()))
+    print ''
+    print 'Some of them double as checks, the exit status is 1 if any of those fail.'
+
+def main():
+    """
+    The main program method
+    """
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'b:r:h', ['batch=', 'repeat=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(1)
+
+    repeat = 20
+    batchFile = None
+    for o, a in opts:
+        if o in ('-h', '--help'):
+            usage()
+            sys.exit()
+        elif o in ('-b', '--batch'):
+            batchFile = a
+        elif o in ('-r', '--repeat'):
+            repeat = int(a)
+        else:
+            assert False, "unhandled option"
+
+    if len(args) == 0:
+        args = sorted(benchmarks.keys())
+    for name in args:
+        if not benchmarks.has_key(name):
+            usage()
+            sys.exit(1)
+
+    queries = load_queries(batchFile)
+    vocabulary, grammar, generator = config.configure()
+    failed = []
+    for name in args:
+        print '=' * 80
+        print name.center(80)
+        print '=' * 80
+        # The ones that double as checks return how many things went wrong
+        if benchmarks[name](vocabulary, grammar, generator, queries, repeat):
+            failed.append(name)
+
+    if len(failed) > 0:
+        print 'FAILED: ' + ', '.join(failed)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
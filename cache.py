@@ -0,0 +1,302 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from debug import *
+
+class ReductionCache(object):
+    """
+    Remembers what WordNet had to say about a word (i.e. "dude" -> "male",
+    or "xyzzy" -> unknown) in an sqlite file, so that the next process
+    doesn't have to ask again. Everything is tied to a fingerprint of the
+    vocabulary, so changing config.py throws the old answers away.
+
+    Lookups return one of:
+        None                    Never seen it
+        ('reduced', word)       It reduces to a base word
+        ('unknown', None)       UnknownWordException
+
+    Non-words (punctuation and such) never make it this far, they're
+    weeded out before WordNet is ever consulted.
+
+    Any number of threads can use one at once, they take turns with the
+    connection.
+    """
+
+    UNKNOWN = 'unknown'
+    REDUCED = 'reduced'
+
+    # Only remember this many words in memory, sqlite has the rest
+    MEMO_SIZE = 4096
+
+    def __init__(self, path, fingerprint):
+        """
+        Open (or create) the cache file at path
+        """
+
+        import sqlite3
+
+        self._path = path
+        self._fingerprint = fingerprint
+        self._memo = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout = 5.0, check_same_thread = False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+        # Files from before rows had a fingerprint of their own
+        columns = [c[1] for c in self._db.execute('PRAGMA table_info(reductions)').fetchall()]
+        if len(columns) > 0 and 'fingerprint' not in columns:
+            self._db.execute('DROP TABLE reductions')
+        self._db.execute('CREATE TABLE IF NOT EXISTS reductions (fingerprint TEXT, word TEXT, kind TEXT, ' +
+                         'reduced TEXT, PRIMARY KEY (fingerprint, word))')
+
+        # Every row says which vocabulary it's for, so a process still on
+        # the old one (i.e. a pre-forked worker that hasn't reloaded yet)
+        # can keep writing without anybody on the new one ever reading it
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            # Different vocabulary, none of this applies anymore
+            debug('Reduction cache is stale, clearing', path)
+            self._db.execute('DELETE FROM reductions WHERE fingerprint != ?', (fingerprint,))
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+        self._db.commit()
+
+    def get(self, word):
+        """
+        Look up a normalized word
+        """
+
+        import sqlite3
+
+        entry = self._memo.get(word)
+        if entry is not None:
+            return entry
+
+        try:
+            with self._lock:
+                if self._db is None:
+                    return None
+                row = self._db.execute('SELECT kind, reduced FROM reductions WHERE fingerprint = ? AND word = ?',
+                                       (self._fingerprint, word)).fetchone()
+        except sqlite3.Error, e:
+            debug('Unable to read from reduction cache:', str(e))
+            return None
+        if row is None:
+            return None
+
+        # sqlite hands back unicode, the rest of us speak str
+        reduced = row[1]
+        if reduced is not None:
+            reduced = str(reduced)
+        entry = (str(row[0]), reduced)
+        self._remember(word, entry)
+        return entry
+
+    def _remember(self, word, entry):
+        """
+        Keep an entry in memory, starting over once there are too many
+        (a server sees no end of different words)
+        """
+
+        if len(self._memo) >= self.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[word] = entry
+
+    def put(self, word, kind, reduced = None):
+        """
+        Remember what a normalized word turned into
+        """
+
+        import sqlite3
+
+        entry = (kind, reduced)
+        self._remember(word, entry)
+        try:
+            with self._lock:
+                if self._db is None:
+                    return
+                self._db.execute('INSERT OR REPLACE INTO reductions (fingerprint, word, kind, reduced) ' +
+                                 'VALUES (?, ?, ?, ?)', (self._fingerprint, word, kind, reduced))
+                self._db.commit()
+        except sqlite3.Error, e:
+            # Somebody else has it locked, or the word is garbage. It's
+            # just a cache, move along.
+            debug('Unable to write to reduction cache:', str(e))
+
+    def reopen(self):
+        """
+        Get a connection of our own after a fork (sqlite connections must
+        never be used on both sides of one). The inherited one is simply
+        dropped, closing it could upset the parent. So is the lock, in
+        case some thread in the parent was holding it.
+        """
+
+        import sqlite3
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self._path, timeout = 5.0, check_same_thread = False)
+
+    def path(self):
+        """
+        Get the path to the cache file
+        """
+
+        return self._path
+
+    def close(self):
+        """
+        Close the cache file. Anybody still using this afterwards gets
+        nothing out of it, and nothing they put in goes anywhere.
+        """
+
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+def open_cache(vocabulary, path):
+    """
+    Hook a ReductionCache up to a vocabulary, if a path was given
+    """
+
+    if path is not None and len(path) > 0:
+        vocabulary.set_cache(ReductionCache(path, vocabulary.fingerprint()))
+
+class ResultCache(object):
+    """
+    Remembers the final classifiers for a reduced sequence of words (i.e.
+    "smiling asian male"). Lots of different searches boil down to the same
+    few reduced forms, and from there on parsing is entirely up to the
+    config, so there's no point doing it twice. Only the size most recently
+    used entries are kept.
+
+    Entries are the finished ClassifierCollection, or the ParserException /
+    UnsupportedSearch that came out instead. Neither one should be changed
+    by whoever gets it back. Any number of threads can use one at once.
+    """
+
+    def __init__(self, size = 1024):
+        """
+        Create an empty cache holding at most size entries
+        """
+
+        self._size = size
+        self._entries = {}
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+        # Circular list of [prev, next, key, entry], oldest first
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+    def get(self, key):
+        """
+        Look up a reduced sequence (a tuple of words), None if it's not there
+        """
+
+        with self._lock:
+            link = self._entries.get(key)
+            if link is None:
+                self._misses += 1
+                return None
+
+            # Back to the end of the line
+            self._unlink(link)
+            self._append(link)
+            self._hits += 1
+            return link[3]
+
+    def put(self, key, entry):
+        """
+        Remember what a reduced sequence turned into, forgetting the least
+        recently used entry if there's no more room
+        """
+
+        if self._size <= 0:
+            return
+
+        with self._lock:
+            link = self._entries.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[3] = entry
+            else:
+                link = [None, None, key, entry]
+                self._entries[key] = link
+            self._append(link)
+
+            while len(self._entries) > self._size:
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._entries[oldest[2]]
+
+    def _unlink(self, link):
+        """
+        Take a link out of the list
+        """
+
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+
+    def _append(self, link):
+        """
+        Put a link at the (most recently used) end of the list
+        """
+
+        last = self._root[0]
+        link[0] = last
+        link[1] = self._root
+        last[1] = link
+        self._root[0] = link
+
+    def size(self):
+        """
+        The most entries this will ever hold
+        """
+
+        return self._size
+
+    def hits(self):
+        """
+        Number of lookups that found something
+        """
+
+        return self._hits
+
+    def misses(self):
+        """
+        Number of lookups that came up empty
+        """
+
+        return self._misses
+
+    def clear(self):
+        """
+        Forget everything (the counters too)
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._root[:] = [self._root, self._root, None, None]
+            self._hits = 0
+            self._misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return '%d/%d entries, %d hits, %d misses' % (len(self._entries), self._size, self._hits, self._misses)
@@ -0,0 +1,610 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# A bottom-up chart parser specialized for one grammar. It does exactly
+# what nltk's BottomUpChartParser does (same agenda, same rules, same
+# order) but with the grammar boiled down to integer ids and lookup
+# tables, and without all of the generic edge/index machinery.
+#
+# Why not CYK? Our grammar is wildly ambiguous ("not a man and a woman")
+# and rparse cares very much which tree it gets. nltk hands back whichever
+# tree falls out of its chart first, which depends on the order edges went
+# in and on how python happens to order each edge's child pointer lists.
+# Doing the same work in the same order, with edges that hash the same way
+# nltk's do, is the only way to get the same tree every time.
+#
+# Either way the chart itself is a packed parse forest: one edge per
+# (production, dot, span), each with the list of ways its children can be
+# put together. It only takes polynomial time and space to build, even
+# when the number of trees is exponential. Asking nltk for its trees
+# unpacks every last one of them, but getting just the first one only
+# means following the first set of children all the way down (see
+# first_tree). That's exact as long as the grammar has no cycles, which
+# is also all CompiledChart knows how to deal with.
+#
+# For search-as-you-type there's also EarleyChart, which goes left to
+# right instead, one token at a time. That makes it the wrong tool for
+# finding nltk's first tree, but the right one for keeping up with
+# someone typing: each token that gets added only adds one more Earley
+# set, and each set says right away whether the tokens so far are a
+# sentence, could still become one, and which tokens could come next.
+#
+# The trees themselves come from IncrementalChart, which keeps a
+# CompiledChart's chart around between keystrokes. Bottom-up, every edge
+# that a token adds ends at that token, and none of the edges before it
+# change (as long as words only show up in productions of their own, like
+# PROD_MALE -> 'male'). So feeding the tokens one at a time builds the
+# very same chart, in the very same order, as parsing them all at once,
+# and taking a token back is just dropping the edges that came after it.
+
+from instrument import count
+
+__all__ = ['CompiledChart', 'IncrementalChart', 'EarleyChart', 'first_tree', 'has_cycles', 'deadline_chart']
+
+def has_cycles(cfg):
+    """
+    Can an nltk grammar derive a symbol from itself without using up any
+    words? That takes empty productions or a loop of unary ones. Charts for
+    grammars like that have edges that are their own descendants, and nltk
+    goes out of its way to leave those trees out.
+    """
+
+    import nltk
+
+    unary = {}
+    for prod in cfg.productions():
+        rhs = prod.rhs()
+        if len(rhs) == 0:
+            return True
+        if len(rhs) == 1 and isinstance(rhs[0], nltk.Nonterminal):
+            unary.setdefault(prod.lhs(), []).append(rhs[0])
+
+    # Depth first search for a loop
+    done = {}
+    def visit(symbol, path):
+        if path.has_key(symbol):
+            return True
+        if done.has_key(symbol):
+            return False
+        path[symbol] = True
+        for child in unary.get(symbol, ()):
+            if visit(child, path):
+                return True
+        del path[symbol]
+        done[symbol] = True
+        return False
+
+    for symbol in unary.keys():
+        if visit(symbol, {}):
+            return True
+    return False
+
+def first_tree(chart, root):
+    """
+    Get the tree chart.parses(root)[0] would, or None if there aren't any,
+    without building all of the others. The chart is an nltk Chart, and its
+    grammar must not have cycles (see has_cycles).
+    """
+
+    import nltk
+    from nltk.parse.chart import LeafEdge
+
+    def build(edge):
+        if isinstance(edge, LeafEdge):
+            return chart.leaf(edge.start())
+        for cpl in chart.child_pointer_lists(edge):
+            return nltk.Tree(edge.lhs().symbol(), [build(child) for child in cpl])
+
+    for edge in chart.select(start = 0, end = chart.num_leaves(), lhs = root):
+        if edge.is_complete():
+            return build(edge)
+    return None
+
+def deadline_chart(deadline):
+    """
+    Get an nltk Chart class (for a ChartParser's chart_class) that checks
+    a deadline.Deadline every time an edge goes in
+    """
+
+    from nltk.parse.chart import Chart
+
+    class _DeadlineChart(Chart):
+        def insert(self, edge, *child_pointer_lists):
+            deadline.check('parsing')
+            return Chart.insert(self, edge, *child_pointer_lists)
+
+    return _DeadlineChart
+
+class _Edge(object):
+    """
+    A chart edge. Leaves have prod == None. Edges are interned, so
+    identity is equality, and they hash exactly like nltk's edges do.
+    """
+
+    __slots__ = ('prod', 'dot', 'start', 'end', 'lhs', 'next', 'cpls', 'hash')
+
+    def __hash__(self):
+        return self.hash
+
+class _Chart(object):
+    """
+    The edges so far, and the indexes into them
+    """
+
+    __slots__ = ('interned', 'edges', 'complete', 'incomplete')
+
+    def __init__(self):
+        self.interned = {}     # (prod, dot, start, end) -> edge
+        self.edges = []        # Insertion order
+        self.complete = {}     # (start, lhs) -> complete edges
+        self.incomplete = {}   # (end, next) -> incomplete edges
+
+class CompiledChart(object):
+    """
+    The tables for parsing with one nltk grammar. Build it once, then
+    call parse() as often as you like.
+    """
+
+    def __init__(self, cfg):
+        """
+        Compile an nltk ContextFreeGrammar
+        """
+
+        self._cfg = cfg
+        self._ids = {}         # Nonterminal or terminal -> id
+        self._symbols = []     # id -> Nonterminal or terminal
+        self._canonical = {}   # (lhs, rhs) -> production id
+
+        # Per production: lhs id, rhs ids, length, and the hashes nltk
+        # would use for the lhs and rhs
+        self._lhs = []
+        self._rhs = []
+        self._len = []
+        self._hashes = []
+
+        # First symbol id -> production ids (duplicates and all, in
+        # grammar order, just like grammar.productions(rhs=...))
+        self._starting = {}
+
+        # Lhs id -> production ids, and production id -> the nltk
+        # Production, for EarleyChart
+        self._expanding = {}
+        self._productions = []
+
+        for prod in cfg.productions():
+            key = (prod.lhs(), prod.rhs())
+            if self._canonical.has_key(key):
+                pid = self._canonical[key]
+            else:
+                pid = len(self._lhs)
+                self._canonical[key] = pid
+                self._lhs.append(self._symbol_id(prod.lhs()))
+                self._rhs.append(tuple([self._symbol_id(s) for s in prod.rhs()]))
+                self._len.append(len(prod.rhs()))
+                self._hashes.append((hash(prod.lhs()), hash(prod.rhs())))
+                self._expanding.setdefault(self._lhs[pid], []).append(pid)
+                self._productions.append(prod)
+            if len(prod.rhs()) > 0:
+                self._starting.setdefault(self._symbol_id(prod.rhs()[0]), []).append(pid)
+
+        self._start = self._symbol_id(cfg.start())
+
+        # Words only ever show up as the whole rhs (i.e. PROD_MALE -> 'male')
+        import nltk
+        self._lexical = True
+        for prod in cfg.productions():
+            if len(prod.rhs()) > 1 and [s for s in prod.rhs() if not isinstance(s, nltk.Nonterminal)]:
+                self._lexical = False
+
+    def _symbol_id(self, symbol):
+        """
+        Get the id for a Nonterminal or terminal, making one up if needed
+        """
+
+        sid = self._ids.get(symbol)
+        if sid is None:
+            sid = len(self._symbols)
+            self._ids[symbol] = sid
+            self._symbols.append(symbol)
+        return sid
+
+    def parse(self, tokens, deadline = None):
+        """
+        Parse a list of tokens. Returns the same tree nltk's
+        nbest_parse(tokens)[0] would, or None if there are no parses.
+        Raises ValueError if the grammar doesn't cover a token, or a
+        TimeoutException if the deadline (a deadline.Deadline) passes.
+        """
+
+        tokens = list(tokens)
+        self._cfg.check_coverage(tokens)
+
+        chart = _Chart()
+        agenda = [self._leaf(chart, index, token) for index, token in enumerate(tokens)]
+        agenda.reverse()
+        self._fill(chart, agenda, deadline)
+        count('chart edges', len(chart.edges))
+
+        edge = self._first(chart, len(tokens))
+        if edge is None:
+            return None
+        return self._tree(edge, tokens)
+
+    def _leaf(self, chart, index, token):
+        """
+        Put the leaf for a token into a chart, returns it
+        """
+
+        leaf = _Edge()
+        leaf.prod = None
+        leaf.dot = 1
+        leaf.start = index
+        leaf.end = index + 1
+        leaf.lhs = self._ids.get(token)
+        leaf.next = None
+        leaf.cpls = {(): True}
+        leaf.hash = hash((index, token))
+        chart.edges.append(leaf)
+        chart.complete.setdefault((index, leaf.lhs), []).append(leaf)
+        return leaf
+
+    def _fill(self, chart, agenda, deadline = None):
+        """
+        Work through the agenda (popping from the end) until it's empty
+        """
+
+        plhs = self._lhs
+        prhs = self._rhs
+        plen = self._len
+        phash = self._hashes
+        starting = self._starting
+
+        interned = chart.interned
+        edges = chart.edges
+        complete = chart.complete
+        incomplete = chart.incomplete
+
+        def insert(prod, dot, start, end, cpls):
+            # Returns the edge if the chart changed, None otherwise
+            key = (prod, dot, start, end)
+            edge = interned.get(key)
+            changed = False
+            if edge is None:
+                edge = _Edge()
+                edge.prod = prod
+                edge.dot = dot
+                edge.start = start
+                edge.end = end
+                edge.lhs = plhs[prod]
+                edge.next = prhs[prod][dot] if dot < plen[prod] else None
+                edge.cpls = {}
+                h = phash[prod]
+                edge.hash = hash((h[0], h[1], (start, end), dot))
+                interned[key] = edge
+                edges.append(edge)
+                if edge.next is None:
+                    complete.setdefault((start, edge.lhs), []).append(edge)
+                else:
+                    incomplete.setdefault((end, edge.next), []).append(edge)
+            mine = edge.cpls
+            for cpl in cpls:
+                if not mine.has_key(cpl):
+                    mine[cpl] = True
+                    changed = True
+            if changed:
+                return edge
+            return None
+
+        while agenda:
+            if deadline is not None:
+                deadline.check('parsing')
+            edge = agenda.pop()
+            if edge.next is None:
+                # Bottom up prediction
+                for prod in starting.get(edge.lhs, ()):
+                    new = insert(prod, 0, edge.start, edge.start, ((),))
+                    if new is not None:
+                        agenda.append(new)
+
+                # Fundamental rule, this edge on the right
+                for left in incomplete.get((edge.start, edge.lhs), ()):
+                    new = insert(left.prod, left.dot + 1, left.start, edge.end,
+                                 [cpl + (edge,) for cpl in left.cpls.keys()])
+                    if new is not None:
+                        agenda.append(new)
+            else:
+                # Fundamental rule, this edge on the left
+                cpls = edge.cpls.keys()
+                for right in complete.get((edge.end, edge.next), ()):
+                    new = insert(edge.prod, edge.dot + 1, edge.start, right.end,
+                                 [cpl + (right,) for cpl in cpls])
+                    if new is not None:
+                        agenda.append(new)
+
+    def _first(self, chart, n):
+        """
+        Get the first complete edge for the start symbol that covers all
+        n tokens, or None
+        """
+
+        for edge in chart.complete.get((0, self._start), ()):
+            if edge.end == n and edge.prod is not None:
+                return edge
+        return None
+
+    def incremental(self):
+        """
+        Can the chart be built one token at a time (see IncrementalChart)?
+        Only if words never share a production with anything else.
+        """
+
+        return self._lexical
+
+    def _tree(self, edge, tokens):
+        """
+        Build the first tree for a complete edge
+        """
+
+        import nltk
+
+        if edge.prod is None:
+            return tokens[edge.start]
+        for cpl in edge.cpls:
+            children = [self._tree(child, tokens) for child in cpl]
+            return nltk.Tree(self._symbols[edge.lhs].symbol(), children)
+
+class IncrementalChart(object):
+    """
+    A CompiledChart's chart for a list of tokens that grows (and sometimes
+    shrinks) one token at a time. Adding a token only adds the edges that
+    end with it, and parse() reads the first tree off of what's there. Only
+    for grammars where CompiledChart.incremental() says so, otherwise the
+    chart wouldn't come out the same as parsing everything at once.
+    """
+
+    def __init__(self, compiled):
+        """
+        Start with no tokens at all, for a CompiledChart
+        """
+
+        self._compiled = compiled
+        self._chart = _Chart()
+        self._tokens = []
+        self._marks = []    # How many edges there were before each token
+
+    def tokens(self):
+        """
+        Get the tokens so far
+        """
+
+        return list(self._tokens)
+
+    def feed(self, token, deadline = None):
+        """
+        Add one more token to the end. Raises ValueError if the grammar
+        doesn't cover it, or a TimeoutException if the deadline passes, and
+        either way it's like the token never showed up.
+        """
+
+        self._compiled._cfg.check_coverage([token])
+
+        index = len(self._tokens)
+        mark = len(self._chart.edges)
+        self._marks.append(mark)
+        self._tokens.append(token)
+        try:
+            leaf = self._compiled._leaf(self._chart, index, token)
+            self._compiled._fill(self._chart, [leaf], deadline)
+        except:
+            self.truncate(index)
+            raise
+        count('chart edges', len(self._chart.edges) - mark)
+
+    def truncate(self, n):
+        """
+        Throw away every token after the first n, and their edges
+        """
+
+        if n >= len(self._tokens):
+            return
+
+        chart = self._chart
+        mark = self._marks[n]
+        for edge in reversed(chart.edges[mark:]):
+            # Whatever came later went in later, so it's always at the end
+            if edge.next is None:
+                key = (edge.start, edge.lhs)
+                index = chart.complete
+            else:
+                key = (edge.end, edge.next)
+                index = chart.incomplete
+            index[key].pop()
+            if not index[key]:
+                del index[key]
+            if edge.prod is not None:
+                del chart.interned[(edge.prod, edge.dot, edge.start, edge.end)]
+
+        del chart.edges[mark:]
+        del self._tokens[n:]
+        del self._marks[n:]
+
+    def advance(self, tokens, deadline = None):
+        """
+        Catch up with a new list of tokens. Only the ones after where it
+        and the old list part ways get fed. Returns how many that was.
+        """
+
+        n = 0
+        while n < len(tokens) and n < len(self._tokens) and tokens[n] == self._tokens[n]:
+            n += 1
+        self.truncate(n)
+        # All at once, so the complaint is the same as CompiledChart.parse's
+        self._compiled._cfg.check_coverage(tokens[n:])
+        for token in tokens[n:]:
+            self.feed(token, deadline)
+        return len(tokens) - n
+
+    def parse(self):
+        """
+        Get the same tree CompiledChart.parse(tokens()) would, or None if
+        there are no parses
+        """
+
+        edge = self._compiled._first(self._chart, len(self._tokens))
+        if edge is None:
+            return None
+        return self._compiled._tree(edge, self._tokens)
+
+class EarleyChart(object):
+    """
+    Earley sets for a list of tokens that grows (and sometimes shrinks)
+    one token at a time. It never builds any trees, IncrementalChart
+    is the one for that. The CompiledChart's grammar has no cycles,
+    so there are no empty productions to worry about either.
+    """
+
+    def __init__(self, compiled):
+        """
+        Start with no tokens at all, for a CompiledChart
+        """
+
+        self._compiled = compiled
+        self._tokens = []
+        self._sets = []
+        self._sets.append(self._closure([(pid, 0, 0) for pid in compiled._expanding.get(compiled._start, ())]))
+
+    def _closure(self, items):
+        """
+        Build the next Earley set from the items that got there by way of
+        a token (or the start ones). An item is (production, dot, start).
+        Returns (next symbol -> items waiting on it, is it a sentence?)
+        """
+
+        c = self._compiled
+        plhs = c._lhs
+        prhs = c._rhs
+        plen = c._len
+        expanding = c._expanding
+        end = len(self._sets)
+
+        seen = {}
+        waiting = {}
+        complete = False
+        agenda = list(items)
+        while agenda:
+            item = agenda.pop()
+            if seen.has_key(item):
+                continue
+            seen[item] = True
+            prod, dot, start = item
+            if dot == plen[prod]:
+                # Completer. Nothing is empty, so start < end and that
+                # set is already done.
+                lhs = plhs[prod]
+                if start == 0 and lhs == c._start:
+                    complete = True
+                for p, d, s in self._sets[start][0].get(lhs, ()):
+                    agenda.append((p, d + 1, s))
+            else:
+                # Predictor, only the first time anything waits on a symbol
+                symbol = prhs[prod][dot]
+                if not waiting.has_key(symbol):
+                    waiting[symbol] = []
+                    for p in expanding.get(symbol, ()):
+                        agenda.append((p, 0, end))
+                waiting[symbol].append(item)
+
+        return (waiting, complete)
+
+    def tokens(self):
+        """
+        Get the tokens so far
+        """
+
+        return list(self._tokens)
+
+    def feed(self, token):
+        """
+        Add one more token
+        """
+
+        sid = self._compiled._ids.get(token)
+        scanned = [(p, d + 1, s) for p, d, s in self._sets[-1][0].get(sid, ())]
+        self._tokens.append(token)
+        self._sets.append(self._closure(scanned))
+
+    def truncate(self, n):
+        """
+        Forget everything after the first n tokens
+        """
+
+        del self._tokens[n:]
+        del self._sets[n + 1:]
+
+    def advance(self, tokens):
+        """
+        Catch up with a new list of tokens. Only the ones after where it
+        and the old list part ways get looked at. Returns how many that was.
+        """
+
+        n = 0
+        while n < len(tokens) and n < len(self._tokens) and tokens[n] == self._tokens[n]:
+            n += 1
+        self.truncate(n)
+        for token in tokens[n:]:
+            self.feed(token)
+        return len(tokens) - n
+
+    def covered(self):
+        """
+        Are all of the tokens in the grammar?
+        """
+
+        ids = self._compiled._ids
+        return len([t for t in self._tokens if not ids.has_key(t)]) == 0
+
+    def viable(self):
+        """
+        Could the tokens so far still be the start of a sentence?
+        """
+
+        return len(self._sets[-1][0]) > 0
+
+    def complete(self):
+        """
+        Are the tokens so far a whole sentence?
+        """
+
+        return self._sets[-1][1]
+
+    def expected(self):
+        """
+        Get the productions that would take a token right away, if one
+        came next (nltk Productions, in grammar order). In our grammar
+        those are all lexical ones like PROD_MALE -> 'male', where the
+        token is production.rhs()[0].
+        """
+
+        import nltk
+
+        c = self._compiled
+        found = {}
+        for symbol, items in self._sets[-1][0].iteritems():
+            if isinstance(c._symbols[symbol], nltk.Nonterminal):
+                continue
+            for prod, dot, start in items:
+                found[prod] = True
+        return [c._productions[pid] for pid in sorted(found.keys())]
@@ -42,27 +42,23 @@ def add_word(vocab, word, production_rule, keys = None, aliases = None):
 
     word = word.strip().lower()
 
-    import nltk, re
-    from nltk.corpus import wordnet as wn
-    from word import BaseWord
+    import re
+    from word import BaseWord, synset_ref
 
     synsets = []
     if keys != None:
         # Create a list of synsets for this word, if any lemmas were provided.
-        if isinstance(keys, (list, tuple)):
-            for k in keys:
-                k = k.strip()
-                s = wn.lemma_from_key(k).synset
-                if s is None:
-                    raise ConfigException('lemma_from_key("%s") returned None' % (keys.strip()))
-                elif s not in synsets:
-                    synsets.append(s)
-        else:
-            s = wn.lemma_from_key(keys.strip()).synset
+        # They're only (pos, offset) for now, WordNet gets loaded if and when
+        # they're actually needed.
+        if not isinstance(keys, (list, tuple)):
+            keys = [keys]
+        for k in keys:
+            k = k.strip()
+            s = synset_ref(k)
             if s is None:
-                raise ConfigException('lemma_from_key("%s") returned None' % (keys.strip()))
+                raise ConfigException('no synset for lemma key "%s"' % (k))
             elif s not in synsets:
-                synsets.append(s)                
+                synsets.append(s)
 
     alias_list = []
 
@@ -141,9 +137,11 @@ def configure():
     """
 
     from generator import ClassifierGenerator
+    from word import Vocabulary
+    from parser import CompiledGrammar
 
     # Supported vocabulary
-    vocab = []
+    vocab = Vocabulary()
 
     # Supported grammar
     gramm = []
@@ -383,6 +381,12 @@ def configure():
         line += '"' + '" | "'.join(items) + '"'
         add_rule(gramm, line)
 
-    grammar = '\n'.join(gramm)
+    grammar = CompiledGrammar('\n'.join(gramm))
+
+    # Build the alias lookup tables now that the vocabulary is complete,
+    # and make sure nobody changes any of this from here on out
+    vocab.freeze()
+    grammar.freeze()
+    gen.freeze()
 
     return (vocab, grammar, gen)
@@ -0,0 +1,93 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Time limits for searches. A Deadline gets handed down through every
+# stage of a search (word reduction, parsing, the classifier gauntlet),
+# and each one calls check() every so often. Once time's up check()
+# raises a TimeoutException and the search is over.
+
+import time
+
+__all__ = ['Deadline', 'TimeoutException']
+
+# Use a clock that never goes backwards when there is one
+_clock = getattr(time, 'monotonic', time.time)
+
+class TimeoutException(Exception):
+    """
+    A search ran out of time
+    """
+    def __init__(self, reason):
+        self.reason = reason
+    def __str__(self):
+        return "Timeout: " + self.reason
+
+class Deadline(object):
+    """
+    The point in time a search has to be done by
+    """
+
+    def __init__(self, seconds, reserve = 0.0):
+        """
+        Start the clock, there are this many seconds to go. The last
+        reserve seconds are held back for something else (see reserved),
+        check() gives up that much sooner.
+        """
+
+        self._seconds = seconds
+        self._final = _clock() + seconds
+        self._end = self._final - reserve
+
+    def reserved(self):
+        """
+        Get a Deadline for whatever is left of the whole thing, the part
+        that was held back included
+        """
+
+        other = Deadline(self._seconds)
+        other._final = self._final
+        other._end = self._final
+        return other
+
+    def seconds(self):
+        """
+        How long the search was given in the first place
+        """
+
+        return self._seconds
+
+    def remaining(self):
+        """
+        How many seconds are left (never less than 0)
+        """
+
+        return max(0.0, self._end - _clock())
+
+    def expired(self):
+        """
+        Is time up?
+        """
+
+        return _clock() >= self._end
+
+    def check(self, doing):
+        """
+        Raise a TimeoutException if time is up. doing says what the search
+        was in the middle of ("parsing", ...).
+        """
+
+        if _clock() >= self._end:
+            raise TimeoutException('gave up while %s (limit %gs)' % (doing, self._seconds))
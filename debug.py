@@ -13,14 +13,21 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+#
+# Debugging is switched on or off once, at startup, and only ever read
+# after that. Messages from different threads never get mixed up in the
+# middle of a line.
 
-import sys
+import sys, threading
 
 __all__ = ['debug', 'set_debug', 'get_debug']
 
 # Debugging
 debugging = False
 
+# One line at a time
+_lock = threading.Lock()
+
 def debug(*args):
     """
     Print a message to stderr
@@ -29,10 +36,10 @@ def debug(*args):
     global debugging
     if not debugging:
         return
-    for stmt in args:
-        print >> sys.stderr, stmt,
-    print >> sys.stderr
-    sys.stderr.flush()
+    line = ' '.join([str(stmt) for stmt in args]) + '\n'
+    with _lock:
+        sys.stderr.write(line)
+        sys.stderr.flush()
 
 def set_debug(enable):
     """
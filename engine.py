@@ -0,0 +1,431 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# For when you want to use NEWMAN from your own code instead of the
+# command line:
+#
+#     from engine import Engine
+#     engine = Engine()
+#     result = engine.search('grinning chinese dude')
+#     if result.ok():
+#         print result.groups()   # [[('Asian', 1.0), ('Male', 1.0), ('Smiling', 1.0)]]
+#     else:
+#         print result.error()    # An exception, see SearchResult
+#
+# And for searching as it gets typed:
+#
+#     session = engine.session()
+#     session.update('grinning chin')    # Same as engine.search('grinning chin')
+#     session.expected()                 # What could come after 'grinning'
+#     session.update('grinning chinese') # Picks up where the last one stopped
+
+import threading
+from search import *
+from parser import *
+from generator import *
+from debug import *
+from instrument import stage
+from deadline import *
+from cache import ResultCache
+
+__all__ = ['Engine', 'SearchResult', 'Session']
+
+class SearchResult(object):
+    """
+    Whatever came out of a single search. Either a list of "OR" groups,
+    each one a list of (classifier, value) pairs, or the error that got in
+    the way. The error is one of:
+
+        UnknownWordsException          Some words aren't known (see .words)
+        SearchException                Nothing left to search for
+        ParserException                The words don't make any sense
+        UnsupportedSearch              The config forbids this search
+        ClassifierGeneratorException   The config is broken
+        TimeoutException               The search ran out of time
+
+    A search that ran out of time may still have groups, if the Engine was
+    asked to fall back on what the aliases alone have to say (see
+    degraded).
+    """
+
+    def __init__(self, phrase, groups = None, error = None):
+        """
+        Create a new result
+        """
+
+        self._phrase = phrase
+        self._groups = groups
+        self._error = error
+
+    def phrase(self):
+        """
+        The phrase that was searched for
+        """
+
+        return self._phrase
+
+    def groups(self):
+        """
+        The classifier->value pairs, one list per "OR" group (None on
+        error, unless the search was degraded)
+        """
+
+        return self._groups
+
+    def error(self):
+        """
+        The exception that stopped the search, or None
+        """
+
+        return self._error
+
+    def ok(self):
+        """
+        Did it work?
+        """
+
+        return self._error is None
+
+    def timed_out(self):
+        """
+        Did the search run out of time?
+        """
+
+        return isinstance(self._error, TimeoutException)
+
+    def degraded(self):
+        """
+        Did the search run out of time, leaving only the groups for the
+        words with aliases (i.e. without any help from WordNet)?
+        """
+
+        return self.timed_out() and self._groups is not None
+
+    def __str__(self):
+        """
+        Exactly what the command line prints
+        """
+
+        if self._error is None:
+            return format_results(self._groups)
+        if self.degraded():
+            return str(self._error) + '\nAliases only: ' + format_results(self._groups)
+        if isinstance(self._error, UnsupportedSearch):
+            return 'Error: ' + str(self._error)
+        return str(self._error)
+
+class Engine(object):
+    """
+    A configured vocabulary, grammar and generator, plus everything
+    else a search needs, all set up once and reused for every search.
+    """
+
+    # How much of the timeout is kept back for the aliases (see degrade)
+    DEGRADE_SHARE = 0.2
+
+    def __init__(self, vocabulary = None, grammar = None, generator = None, cacheSize = 1024,
+                 tokenizerName = 'regex', timeout = None, degrade = False):
+        """
+        Wrap the results of config.configure(), or call it if nothing
+        was given. The results for up to cacheSize reduced searches are
+        remembered (0 turns that off). Searches are split up with the
+        tokenizer called tokenizerName (see search.TOKENIZERS).
+
+        Each search gets timeout seconds (None means forever), after that
+        its result is a TimeoutException. With degrade set, the last
+        DEGRADE_SHARE of that is kept back: a search that's still going by
+        then gets what's left to come up with something using nothing but
+        the aliases, so it's still all over within timeout seconds.
+
+        The vocabulary, grammar and generator get frozen (if they weren't
+        already), after that one Engine can be searched from any number
+        of threads at once.
+        """
+
+        if tokenizerName not in TOKENIZERS:
+            raise SearchException('unknown tokenizer "' + tokenizerName + '"')
+
+        if vocabulary is None:
+            import config
+            vocabulary, grammar, generator = config.configure()
+
+        self._vocabulary = vocabulary
+        self._grammar = compile_grammar(grammar)
+        self._generator = generator
+        self._vocabulary.freeze()
+        self._grammar.freeze()
+        self._generator.freeze()
+
+        self._tokenizerName = tokenizerName
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        self._results = ResultCache(cacheSize)
+        self._timeout = timeout
+        self._degrade = degrade
+
+    def vocabulary(self):
+        """
+        Get the Vocabulary
+        """
+
+        return self._vocabulary
+
+    def grammar(self):
+        """
+        Get the CompiledGrammar
+        """
+
+        return self._grammar
+
+    def generator(self):
+        """
+        Get the ClassifierGenerator
+        """
+
+        return self._generator
+
+    def cache(self):
+        """
+        Get the ResultCache
+        """
+
+        return self._results
+
+    def tokenizer(self):
+        """
+        Get the tokenizer, loading it the first time around
+        """
+
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    self._tokenizer = make_tokenizer(self._tokenizerName)
+        return self._tokenizer
+
+    def warm(self):
+        """
+        Load everything a search might need right now, instead of when
+        the first search that needs it comes along: WordNet, the synsets
+        and ancestors for the vocabulary, and the tokenizer (fallback and
+        all). Mostly useful before forking.
+        """
+
+        from nltk.corpus import wordnet as wn
+
+        wn.synsets('person')
+        self._vocabulary.ancestors()
+        tokenizer = self.tokenizer()
+        if isinstance(tokenizer, RegexTokenizer):
+            tokenizer.fallback()
+
+    def reconfigure(self, vocabulary, grammar, generator):
+        """
+        Get a new Engine, set up just like this one (and sharing its
+        tokenizer), for a different vocabulary, grammar and generator.
+        The result cache comes along if the grammar and generator are
+        the very same ones, since then nothing in it could have changed.
+        """
+
+        engine = Engine(vocabulary, grammar, generator, self._results.size(), self._tokenizerName,
+                        self._timeout, self._degrade)
+        engine._tokenizer = self._tokenizer
+        if engine._grammar is self._grammar and generator is self._generator:
+            engine._results = self._results
+        return engine
+
+    def after_fork(self):
+        """
+        Call this in the child after a fork, so it doesn't share anything
+        with the parent that it shouldn't (the reduction cache connection)
+        """
+
+        cache = self._vocabulary.cache()
+        if cache is not None:
+            cache.reopen()
+
+    def _search(self, phrase, tokenizer, memo = None, known = None, chart = None):
+        """
+        Run one search with an already loaded tokenizer (memo, known and
+        chart are for a Session, see search.classify)
+        """
+
+        deadline = None
+        if self._timeout is not None:
+            reserve = 0.0
+            if self._degrade:
+                reserve = self._timeout * self.DEGRADE_SHARE
+            deadline = Deadline(self._timeout, reserve)
+
+        try:
+            with stage('search'):
+                classifiers = classify(phrase, self._vocabulary, self._grammar, self._generator, tokenizer,
+                                       self._results, deadline, False, memo, known, chart)
+        except TimeoutException, e:
+            if get_debug():
+                debug(str(e))
+            if self._degrade:
+                return self._degraded(phrase, tokenizer, e, deadline.reserved())
+            return SearchResult(phrase, None, e)
+        except (SearchException, ParserException, UnsupportedSearch, ClassifierGeneratorException), e:
+            return SearchResult(phrase, None, e)
+        return SearchResult(phrase, classifiers.results())
+
+    def _degraded(self, phrase, tokenizer, timeout, deadline):
+        """
+        Try again with just the aliases after a search ran out of time,
+        by the deadline that was kept back for it
+        """
+
+        try:
+            classifiers = classify(phrase, self._vocabulary, self._grammar, self._generator, tokenizer,
+                                   None, deadline, True)
+        except (SearchException, ParserException, UnsupportedSearch, ClassifierGeneratorException,
+                TimeoutException):
+            return SearchResult(phrase, None, timeout)
+        return SearchResult(phrase, classifiers.results(), timeout)
+
+    def search(self, phrase):
+        """
+        Search for a phrase, returns a SearchResult
+        """
+
+        return self._search(phrase, self.tokenizer())
+
+    def session(self):
+        """
+        Start searching as someone types, see Session
+        """
+
+        return Session(self)
+
+    def search_many(self, phrases, threads = 1):
+        """
+        Search for a bunch of phrases, returns a list of SearchResult
+        objects in the same order. With threads > 1 the searches are
+        spread across a pool of that many threads.
+        """
+
+        tokenizer = self.tokenizer()
+        if threads <= 1:
+            return [self._search(phrase, tokenizer) for phrase in phrases]
+
+        from multiprocessing.dummy import Pool
+
+        pool = Pool(threads)
+        try:
+            return pool.map(lambda phrase: self._search(phrase, tokenizer), phrases)
+        finally:
+            pool.close()
+            pool.join()
+
+class Session(object):
+    """
+    Search-as-you-type for one search box. Hand update() the whole text
+    every time it changes, and get back exactly what Engine.search() would
+    have, only without starting from scratch every time. Each token gets
+    reduced just once, and the chart the reduced words get parsed with is
+    kept (see chart.IncrementalChart): one more word only adds the edges
+    that end with it, and a deleted one only drops its own. The text still
+    gets preprocessed and tokenized all over again, and the tree that's
+    read off the chart still goes through rparse and the classifiers.
+
+    That's the compiled chart whichever parser the engine uses, which gives
+    the same trees as nltk. expected() says what could come next. A Session
+    sticks with the Engine it was started from, and isn't meant to be
+    shared between threads.
+    """
+
+    # Start forgetting tokens after this many, that's a lot of typing
+    MEMO_SIZE = 4096
+
+    def __init__(self, engine):
+        """
+        Start with nothing typed yet
+        """
+
+        from chart import IncrementalChart, EarleyChart
+
+        compiled = engine.grammar().compiled()
+        if compiled is None:
+            raise ParserException('search-as-you-type can\'t handle empty productions or unary cycles')
+        if not compiled.incremental():
+            raise ParserException('search-as-you-type needs words to have productions of their own')
+        self._engine = engine
+        self._chart = IncrementalChart(compiled)
+        self._prefix = EarleyChart(compiled)
+        self._known = []
+        self._memo = {}
+        self._text = ''
+        self._result = None
+
+    def update(self, text):
+        """
+        The text is now this, returns its SearchResult
+        """
+
+        if len(self._memo) > self.MEMO_SIZE:
+            self._memo.clear()
+        self._text = text
+        self._result = self._engine._search(text, self._engine.tokenizer(), self._memo, self._known,
+                                           self._chart)
+        return self._result
+
+    def append(self, text):
+        """
+        Some more text got typed at the end, returns the SearchResult
+        """
+
+        return self.update(self._text + text)
+
+    def text(self):
+        """
+        Get the text so far
+        """
+
+        return self._text
+
+    def result(self):
+        """
+        Get the last SearchResult (None before the first update)
+        """
+
+        return self._result
+
+    def words(self):
+        """
+        Get the reduced words so far. That's all of them, unless some
+        aren't known, then it's the ones before those.
+        """
+
+        return list(self._known)
+
+    def viable(self):
+        """
+        Could those words still be the start of a search that works?
+        """
+
+        self._prefix.advance(self._known)
+        return self._prefix.viable()
+
+    def expected(self):
+        """
+        Get the productions that could take the next word (see
+        chart.EarleyChart.expected), for autocompleting. The words
+        themselves are production.rhs()[0].
+        """
+
+        self._prefix.advance(self._known)
+        return self._prefix.expected()
@@ -35,6 +35,8 @@ class UnsupportedSearch(Exception):
         self.desc = search_desc
     def __str__(self):
         return str(self.desc)
+    def __reduce__(self):
+        return (UnsupportedSearch, (self.desc,))
 
 class ClassifierResult(object):
     """
@@ -92,16 +94,73 @@ class ProductionSymbol(object):
         """
         return "1" if self._negate else "0"
 
+def _same_code(a, b):
+    """
+    Do two code objects do the same thing? Unlike ==, where they sit in
+    the file (the line numbers) doesn't matter.
+    """
+
+    if (a.co_code, a.co_names, a.co_varnames, a.co_freevars, a.co_argcount, a.co_flags) != \
+            (b.co_code, b.co_names, b.co_varnames, b.co_freevars, b.co_argcount, b.co_flags):
+        return False
+    if len(a.co_consts) != len(b.co_consts):
+        return False
+    for x, y in zip(a.co_consts, b.co_consts):
+        if hasattr(x, 'co_code') and hasattr(y, 'co_code'):
+            if not _same_code(x, y):
+                return False
+        elif type(x) != type(y) or x != y:
+            return False
+    return True
+
+def _same_mapping(a, b):
+    """
+    Do two mappings (see ClassifierGenerator.add_mapping) come up with
+    the same classifiers?
+    """
+
+    if isinstance(a, UnsupportedSearch) or isinstance(b, UnsupportedSearch):
+        return isinstance(a, UnsupportedSearch) and isinstance(b, UnsupportedSearch) and a.desc == b.desc
+    if isinstance(a, (list, tuple)) or isinstance(b, (list, tuple)):
+        return isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)) and \
+            [(c.name(), c.value()) for c in a] == [(c.name(), c.value()) for c in b]
+    if a is b:
+        return True
+    if not hasattr(a, 'func_code') or not hasattr(b, 'func_code'):
+        return False
+    if not _same_code(a.func_code, b.func_code) or a.func_defaults != b.func_defaults:
+        return False
+    acells = [c.cell_contents for c in a.func_closure or ()]
+    bcells = [c.cell_contents for c in b.func_closure or ()]
+    return acells == bcells
+
 class ClassifierGenerator(object):
     """
     Generate classifiers based on production symbols
+
+    Once frozen (config.configure() does that) no more mappings can be
+    added, and nothing in here ever changes again, so any number of
+    threads can share one.
     """
 
+    # Never changes once this is set, see freeze
+    _frozen = False
+
     def __init__(self):
         """
         Construct a new ClassifierGenerator
         """
+
+        # Every distinct (name, negate) pair that appears in a mapping gets a
+        # small integer id. A mapping's key is the sorted tuple of the ids of
+        # its symbols, which makes it a multiset -- order doesn't matter.
         self._mapping = {}
+        self._symbols = {}
+        self._names = []
+
+        # Every sub-multiset of every key, so we can tell early on when a
+        # run of symbols can never be part of any mapping
+        self._partials = set()
 
     def _symbols_to_list(self, symbols):
         """
@@ -116,31 +175,98 @@ class ClassifierGenerator(object):
                 return []
             return [symbols]
 
-    def _symbols_to_key(self, symbols):
+    def _symbol_id(self, name, negate, create = False):
+        """
+        Get the id for a (name, negate) pair. None if it's never been seen
+        (unless create is set, then it gets one).
+        """
+        pair = (name, True if negate else False)
+        sid = self._symbols.get(pair)
+        if sid is None and create:
+            sid = len(self._names)
+            self._symbols[pair] = sid
+            self._names.append(pair[0] + ':' + ('1' if pair[1] else '0'))
+        return sid
+
+    def _symbols_to_key(self, symbols, create = False):
         """
-        Create a string from one or more ProductionSymbol objects
-        to be used to index into the mapping dictionary.
+        Create a key from one or more ProductionSymbol objects to be used
+        to index into the mapping dictionary. Returns None if there are no
+        usable symbols, or False if one of them has never been mapped.
         """
         if symbols is None:
             return None
         symbols = self._symbols_to_list(symbols)
-        tmp = [s.name() + ':' + s.negname() for s in symbols
+        ids = [self._symbol_id(s.name(), s.negate(), create) for s in symbols
                if s is not None and len(s.name()) > 0]
-        if len(tmp) == 0:
+        if len(ids) == 0:
             return None
-        tmp.sort()
-        return ';'.join(tmp)
+        if None in ids:
+            return False
+        ids.sort()
+        return tuple(ids)
 
-    def _get_key(self, symbols):
+    def _key_to_str(self, key):
+        """
+        Something readable for error messages (i.e. "PROD_MALE:0;PROD_SMILING:1")
+        """
+        names = [self._names[sid] for sid in key]
+        names.sort()
+        return ';'.join(names)
+
+    def _get_key(self, symbols, create = False):
         """
         Given one or more production symbols, get the key.
         The only way key is None is if symbols is invalid.
         """
-        key = self._symbols_to_key(symbols)
+        key = self._symbols_to_key(symbols, create)
         if key is None:
             raise ClassifierGeneratorException('invalid symbol(s)')
         return key
 
+    def symbol_ids(self, pairs):
+        """
+        Intern a list of (name, negate) pairs, as collected by the parser.
+        Pairs which aren't part of any mapping come back as None.
+        """
+        return [self._symbols.get((name.strip().upper(), True if negate else False)) for (name, negate) in pairs]
+
+    def key(self, ids):
+        """
+        Turn a run of symbol ids into a mapping key, or None if that
+        can't possibly be one
+        """
+        if None in ids:
+            return None
+        key = list(ids)
+        key.sort()
+        return tuple(key)
+
+    def has_mapping(self, key):
+        """
+        Is there a mapping for this key?
+        """
+        return key in self._mapping
+
+    def reach(self, ids, start):
+        """
+        How many symbols, starting at ids[start], could possibly be covered
+        by a single mapping? Any run starting there that's longer than this
+        is guaranteed not to have a mapping.
+        """
+        count = 0
+        run = []
+        while start + count < len(ids):
+            sid = ids[start + count]
+            if sid is None:
+                break
+            run.append(sid)
+            run.sort()
+            if tuple(run) not in self._partials:
+                break
+            count += 1
+        return count
+
     def add_mapping(self, symbols, classifiers):
         """
         symbols: A tuple of ProductionSymbol objects (or a singular of said type)
@@ -158,9 +284,12 @@ class ClassifierGenerator(object):
             (2) A list of ClassifierResult objects to map (or a singular of said type)
         """
 
-        key = self._get_key(symbols)
+        if self._frozen:
+            raise ClassifierGeneratorException('the generator is frozen')
+
+        key = self._get_key(symbols, True)
         if self._mapping.has_key(key):
-            raise ClassifierGeneratorException('duplicate mapping: ' + key)
+            raise ClassifierGeneratorException('duplicate mapping: ' + self._key_to_str(key))
 
         if callable(classifiers):
             # It's a lambda expression or something, just add it with no further processing
@@ -183,6 +312,44 @@ class ClassifierGenerator(object):
 
             self._mapping[key] = tmp
 
+        # Remember every piece of this key
+        for n in xrange(1, 1 << len(key)):
+            self._partials.add(tuple([key[i] for i in xrange(len(key)) if n & (1 << i)]))
+
+    def freeze(self):
+        """
+        No more mappings from here on out. The lists of classifiers
+        become tuples so nobody can change them by accident either.
+        """
+
+        for key, classifiers in self._mapping.items():
+            if isinstance(classifiers, list):
+                self._mapping[key] = tuple(classifiers)
+        self._names = tuple(self._names)
+        self._partials = frozenset(self._partials)
+        self._frozen = True
+
+    def frozen(self):
+        """
+        Has freeze been called?
+        """
+
+        return self._frozen
+
+    def same_as(self, other):
+        """
+        Does other have exactly the same mappings? Functions count as the
+        same if their code and closures are, even if one of them came from
+        an older copy of config.py.
+        """
+
+        if list(self._names) != list(other._names) or len(self._mapping) != len(other._mapping):
+            return False
+        for key, classifiers in self._mapping.items():
+            if not other._mapping.has_key(key) or not _same_mapping(classifiers, other._mapping[key]):
+                return False
+        return True
+
     def get_mapping(self, symbols, desperate):
         """
         Get a mapping for a given set of symbols. Returns None if there is
@@ -191,6 +358,16 @@ class ClassifierGenerator(object):
         """
 
         key = self._get_key(symbols)
+        if not self._mapping.has_key(key):
+            return None
+        return self.get_mapping_by_key(key, symbols, desperate)
+
+    def get_mapping_by_key(self, key, symbols, desperate):
+        """
+        Same as get_mapping, for when the key has already been worked out
+        (see symbol_ids and key).
+        """
+
         if not self._mapping.has_key(key):
             return None
 
@@ -0,0 +1,411 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Searches over HTTP, JSON in and JSON out:
+#
+#     POST /search  {"query": "grinning chinese dude"}
+#     => {"query": "grinning chinese dude", "error": null,
+#         "groups": [[{"classifier": "Asian", "value": 1.0}, ...]]}
+#
+#     POST /search  {"queries": ["grinning chinese dude", "old man"]}
+#     => {"results": [{"query": "grinning chinese dude", ...}, ...]}
+#
+#     GET /search?q=grinning+chinese+dude   (same as the first one)
+#     GET /status                           (queue and cache numbers)
+#
+# Every connection gets its own thread, but none of them ever search
+# anything themselves. The queries all go into one bounded queue, and a
+# single batching thread takes whatever has piled up (up to a point)
+# and runs it all in one go, either on the Engine or spread across a
+# pool of worker processes. Either way whatever a batch needs set up
+# (tokenizer, pool round trip, ...) is only paid for once per batch.
+
+import sys, threading, Queue, BaseHTTPServer, SocketServer
+from debug import *
+
+__all__ = ['Batcher', 'BatcherBusy', 'serve_http', 'parse_address']
+
+# The most queries a single request can have
+MAX_QUERIES = 1000
+
+class BatcherBusy(Exception):
+    """
+    The queue is full, try again later
+    """
+    def __init__(self, reason):
+        self.reason = reason
+    def __str__(self):
+        return self.reason
+
+class _Pending(object):
+    """
+    Some queries waiting for their records
+    """
+
+    def __init__(self, queries):
+        self.queries = queries
+        self.records = None
+        self.error = None
+        self.done = threading.Event()
+
+class Batcher(object):
+    """
+    Collects queries from any number of threads and runs them in small
+    batches on a single thread. run(queries) has to return one result
+    record (see stream.result_record) per query.
+    """
+
+    def __init__(self, run, size = 32, wait = 0.002, backlog = 256):
+        """
+        Batches hold up to size queries. Once one query shows up, the
+        batch waits up to wait seconds for more. No more than backlog
+        requests can be waiting at once.
+        """
+
+        self._run = run
+        self._size = size
+        self._wait = wait
+        self._queue = Queue.Queue(backlog)
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._queries = 0
+
+        thread = threading.Thread(target = self._loop, name = 'batcher')
+        thread.setDaemon(True)
+        thread.start()
+
+    def submit(self, queries):
+        """
+        Run a list of queries, returns their records once they're done.
+        Raises BatcherBusy if too many requests are already waiting.
+        """
+
+        pending = _Pending(queries)
+        try:
+            self._queue.put(pending, False)
+        except Queue.Full:
+            raise BatcherBusy('too many searches waiting')
+
+        # Event.wait() without a timeout can't be interrupted
+        while not pending.done.isSet():
+            pending.done.wait(1.0)
+        if pending.error is not None:
+            raise pending.error
+        return pending.records
+
+    def stats(self):
+        """
+        Get a dictionary of numbers about how things are going
+        """
+
+        self._lock.acquire()
+        try:
+            return {'batches': self._batches, 'queries': self._queries, 'waiting': self._queue.qsize()}
+        finally:
+            self._lock.release()
+
+    def _collect(self):
+        """
+        Wait for something to do, then for a little more
+        """
+
+        import time
+
+        batch = [self._queue.get()]
+        count = len(batch[0].queries)
+        end = time.time() + self._wait
+        while count < self._size:
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(True, remaining)
+            except Queue.Empty:
+                break
+            batch.append(pending)
+            count += len(pending.queries)
+        return batch
+
+    def _loop(self):
+        """
+        Run batches forever
+        """
+
+        while True:
+            batch = self._collect()
+            queries = []
+            for pending in batch:
+                queries.extend(pending.queries)
+
+            try:
+                records = self._run(queries)
+            except Exception, e:
+                for pending in batch:
+                    pending.error = e
+                    pending.done.set()
+                continue
+
+            self._lock.acquire()
+            self._batches += 1
+            self._queries += len(queries)
+            self._lock.release()
+
+            start = 0
+            for pending in batch:
+                pending.records = records[start:start + len(pending.queries)]
+                start += len(pending.queries)
+                pending.done.set()
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Turns HTTP requests into queries for the Batcher
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'NEWMAN'
+
+    def _reply(self, status, body):
+        """
+        Send back some JSON
+        """
+
+        import json
+
+        text = json.dumps(body, sort_keys = True) + '\n'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def _error(self, status, kind, message):
+        """
+        Send back an error
+        """
+
+        self._reply(status, {'error': {'type': kind, 'message': message}})
+
+    def _search(self, queries, single):
+        """
+        Run the queries and send back the records
+        """
+
+        if len(queries) > MAX_QUERIES:
+            self._error(413, 'TooManyQueries', 'at most %d queries per request' % (MAX_QUERIES))
+            return
+        if [q for q in queries if not isinstance(q, basestring) or len(q.strip()) == 0]:
+            self._error(400, 'BadRequest', 'queries must be non-empty strings')
+            return
+        queries = [q.encode('utf-8') if isinstance(q, unicode) else q for q in queries]
+
+        try:
+            records = self.server.batcher.submit(queries)
+        except BatcherBusy, e:
+            self._error(503, 'Busy', str(e))
+            return
+        except Exception, e:
+            self._error(500, e.__class__.__name__, str(e))
+            return
+
+        if single:
+            self._reply(200, records[0])
+        else:
+            self._reply(200, {'results': records})
+
+    def do_GET(self):
+        """
+        GET /search?q=... or /status
+        """
+
+        import urlparse
+
+        url = urlparse.urlparse(self.path)
+        if url.path == '/status':
+            status = self.server.batcher.stats()
+            if self.server.engine is not None:
+                status['cache'] = str(self.server.engine.cache())
+            self._reply(200, status)
+        elif url.path == '/search':
+            params = urlparse.parse_qs(url.query)
+            if len(params.get('q', [])) != 1:
+                self._error(400, 'BadRequest', 'need exactly one q parameter')
+                return
+            self._search(params['q'], True)
+        else:
+            self._error(404, 'NotFound', 'no such thing: ' + url.path)
+
+    def do_POST(self):
+        """
+        POST /search with {"query": ...} or {"queries": [...]}
+        """
+
+        import json
+
+        if self.path != '/search':
+            self._error(404, 'NotFound', 'no such thing: ' + self.path)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', '0'))
+            body = json.loads(self.rfile.read(length))
+        except ValueError, e:
+            self._error(400, 'BadRequest', 'bad JSON: ' + str(e))
+            return
+
+        if isinstance(body, dict) and body.has_key('query'):
+            self._search([body['query']], True)
+        elif isinstance(body, dict) and isinstance(body.get('queries'), list):
+            self._search(body['queries'], False)
+        else:
+            self._error(400, 'BadRequest', 'expected {"query": ...} or {"queries": [...]}')
+
+    def log_message(self, format, *args):
+        """
+        Only chatter when debugging
+        """
+
+        if get_debug():
+            debug(self.address_string(), '-', format % args)
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A thread per connection, which does nothing but wait on the Batcher
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, batcher, engine):
+        self.batcher = batcher
+        self.engine = engine
+        BaseHTTPServer.HTTPServer.__init__(self, address, _Handler)
+
+def parse_address(text):
+    """
+    Turn "PORT" or "HOST:PORT" into a (host, port) tuple, the host is
+    localhost unless given. Raises ValueError if it makes no sense.
+    """
+
+    host = '127.0.0.1'
+    if ':' in text:
+        host, text = text.rsplit(':', 1)
+    port = int(text)
+    if port < 0 or port > 65535:
+        raise ValueError('bad port: ' + text)
+    return (host, port)
+
+def _engine_runner(server):
+    """
+    Runs batches on the server's Engine in this process, the whole batch
+    on whichever one it was when the batch started
+    """
+
+    from stream import result_record
+
+    def run(queries):
+        engine = server.engine
+        return [result_record(None, result) for result in engine.search_many(queries)]
+    return run
+
+def _run_query(query):
+    """
+    Runs a single search in a worker process, returns the record along
+    with whatever the worker profiled (see instrument.collect)
+    """
+
+    from stream import worker, result_record
+    from instrument import collect
+
+    return (result_record(None, worker().search(query)), collect())
+
+def _pool_runner(pool):
+    """
+    Runs batches across a pool of worker processes (see stream.init_worker)
+    """
+
+    from instrument import merge
+
+    def run(queries):
+        records = []
+        for record, stats in pool.map(_run_query, queries):
+            merge(stats)
+            records.append(record)
+        return records
+    return run
+
+def serve_http(address, engine = None, jobs = 1, setup = (), workers = 1, reloadInterval = None):
+    """
+    Answer searches over HTTP on address, a (host, port) tuple, until
+    killed. With jobs > 1 the engine is ignored (and may be None), the
+    searches go to a pool of processes set up with stream.make_engine(*setup).
+    With workers > 1 the engine gets warmed up instead, and that many
+    pre-forked workers share it (see prefork), each batching on its own.
+    With a reloadInterval (not with jobs > 1), config.py gets checked for
+    changes that often, see reloader.
+    """
+
+    import signal
+
+    pool = None
+    batcher = None
+    if workers > 1:
+        engine.warm()
+    elif jobs > 1:
+        import multiprocessing
+        from stream import init_worker
+        pool = multiprocessing.Pool(jobs, init_worker, tuple(setup))
+        batcher = Batcher(_pool_runner(pool), 16 * jobs)
+        engine = None
+
+    server = _Server(address, batcher, engine)
+    if pool is None and workers <= 1:
+        server.batcher = Batcher(_engine_runner(server))
+
+    reloader = None
+    if reloadInterval is not None and engine is not None:
+        from reloader import Reloader
+
+        def swapped(engine):
+            server.engine = engine
+        reloader = Reloader(engine, swapped, reloadInterval)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if get_debug():
+        debug('Listening on http://%s:%d/' % server.server_address)
+    try:
+        if workers > 1:
+            from prefork import prefork
+
+            # Threads don't survive a fork, so every worker starts its own
+            def init():
+                engine.after_fork()
+                server.batcher = Batcher(_engine_runner(server))
+                if reloader is not None:
+                    reloader.start()
+            prefork(server, workers, init)
+        else:
+            if reloader is not None:
+                reloader.start()
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        server.server_close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return 0
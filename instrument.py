@@ -0,0 +1,220 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Where does the time go? The search pipeline marks the stages it goes
+# through and counts the interesting things it does along the way:
+#
+#     with stage('chart'):
+#         trees = parser.nbest_parse(parts)
+#     count('chart edges', len(edges))
+#
+# All of that goes to the sink, which is anything with a stage(name,
+# seconds) and a count(name, amount) method (Profile just adds it all up).
+# There's no sink unless somebody installs one, and until then stage()
+# hands back a do-nothing object and count() returns straight away.
+
+import sys, time, threading
+
+__all__ = ['Profile', 'STAGES', 'stage', 'count', 'set_sink', 'get_sink', 'collect', 'merge']
+
+# The stages of a search, in the order they happen. 'search' is the
+# whole thing, everything else is a piece of it.
+STAGES = ('search', 'preprocess', 'tokenize', 'reduce', 'compile', 'chart', 'rparse', 'finish')
+
+# Use a clock that never goes backwards when there is one
+_clock = getattr(time, 'monotonic', time.time)
+
+_sink = None
+
+class _NoStage(object):
+    """
+    What stage() hands out when nobody is listening
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_nostage = _NoStage()
+
+class _Stage(object):
+    """
+    Times one trip through a stage, exceptions and all
+    """
+
+    __slots__ = ('_name', '_start')
+
+    def __init__(self, name):
+        self._name = name
+
+    def __enter__(self):
+        self._start = _clock()
+        return self
+
+    def __exit__(self, *exc):
+        _sink.stage(self._name, _clock() - self._start)
+        return False
+
+def stage(name):
+    """
+    Time a stage, use it with a with statement
+    """
+
+    if _sink is None:
+        return _nostage
+    return _Stage(name)
+
+def count(name, amount = 1):
+    """
+    Count something
+    """
+
+    if _sink is not None:
+        _sink.count(name, amount)
+
+def set_sink(sink):
+    """
+    Send everything to sink from now on (None turns it all off)
+    """
+
+    global _sink
+    _sink = sink
+
+def get_sink():
+    """
+    Get the sink, or None
+    """
+
+    return _sink
+
+def collect():
+    """
+    Take everything a Profile sink has added up so far (see
+    Profile.drain), or None if there isn't one. Worker processes hand
+    this back to the parent, which merge()s it into its own.
+    """
+
+    if isinstance(_sink, Profile):
+        return _sink.drain()
+    return None
+
+def merge(stats):
+    """
+    Add what collect() returned somewhere else to the sink
+    """
+
+    if stats is not None and isinstance(_sink, Profile):
+        _sink.merge(stats)
+
+class Profile(object):
+    """
+    A sink that adds up the time spent in each stage and every count,
+    and prints out a breakdown at the end
+    """
+
+    def __init__(self):
+        """
+        Start from nothing
+        """
+
+        self._stages = {}   # name -> [calls, seconds]
+        self._counts = {}   # name -> total
+
+        # Searches on different threads all add to the same numbers
+        self._lock = threading.Lock()
+
+    def stage(self, name, seconds):
+        """
+        A trip through a stage took this long
+        """
+
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                self._stages[name] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def count(self, name, amount):
+        """
+        Add to a counter
+        """
+
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def drain(self):
+        """
+        Take everything added up so far (something picklable), and start
+        over from nothing
+        """
+
+        with self._lock:
+            stats = (self._stages, self._counts)
+            self._stages = {}
+            self._counts = {}
+        return stats
+
+    def merge(self, stats):
+        """
+        Add in something drain() returned
+        """
+
+        stages, counts = stats
+        with self._lock:
+            for name, (calls, seconds) in stages.items():
+                entry = self._stages.setdefault(name, [0, 0.0])
+                entry[0] += calls
+                entry[1] += seconds
+            for name, amount in counts.items():
+                self._counts[name] = self._counts.get(name, 0) + amount
+
+    def report(self, out = sys.stderr):
+        """
+        Print out the breakdown
+        """
+
+        names = [s for s in STAGES if self._stages.has_key(s)]
+        others = [s for s in self._stages.keys() if s not in STAGES]
+        others.sort()
+        names.extend(others)
+
+        searches = self._stages.get('search', [0, 0.0])
+        total = searches[1]
+
+        print >> out, '%-16s %8s %12s %10s %7s' % ('Stage', 'Calls', 'Total ms', 'Mean ms', '%')
+        for name in names:
+            calls, seconds = self._stages[name]
+            percent = '-'
+            if total > 0:
+                percent = '%.1f' % (100.0 * seconds / total)
+            print >> out, '%-16s %8d %12.1f %10.3f %7s' % (name, calls, seconds * 1000.0,
+                                                          seconds * 1000.0 / calls, percent)
+
+        names = self._counts.keys()
+        names.sort()
+        if len(names) > 0:
+            print >> out
+            print >> out, '%-16s %8s %12s' % ('Counter', 'Total', 'Per search')
+            for name in names:
+                perSearch = '-'
+                if searches[0] > 0:
+                    perSearch = '%.1f' % (float(self._counts[name]) / searches[0])
+                print >> out, '%-16s %8d %12s' % (name, self._counts[name], perSearch)
+        out.flush()
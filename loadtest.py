@@ -0,0 +1,203 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Hammers a running "newman.py --http" with searches from a bunch of
+# client threads, and reports the latency percentiles and throughput:
+#
+#     $> python newman.py --http 8080 &
+#     $> python loadtest.py -u http://127.0.0.1:8080 -c 16 -n 2000
+
+import sys, os, getopt, time, threading
+
+def percentile(values, fraction):
+    """
+    Get a percentile (0.0 - 1.0) out of a sorted list
+    """
+
+    if len(values) == 0:
+        return 0.0
+    return values[int(round(fraction * (len(values) - 1)))]
+
+class Client(threading.Thread):
+    """
+    Sends requests over one keep-alive connection until there are none
+    left to send
+    """
+
+    def __init__(self, host, port, bodies, counter):
+        """
+        bodies is the list of request bodies, counter is shared by all
+        the clients ([next index, lock])
+        """
+
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self._host = host
+        self._port = port
+        self._bodies = bodies
+        self._counter = counter
+        self.latencies = []
+        self.failures = 0
+        self.errors = 0
+
+    def _next(self):
+        """
+        Claim the next request, or None if they're all gone
+        """
+
+        lock = self._counter[1]
+        lock.acquire()
+        try:
+            n = self._counter[0]
+            if n >= len(self._bodies):
+                return None
+            self._counter[0] = n + 1
+            return self._bodies[n]
+        finally:
+            lock.release()
+
+    def run(self):
+        """
+        Send requests
+        """
+
+        import httplib, json
+
+        conn = httplib.HTTPConnection(self._host, self._port)
+        headers = {'Content-Type': 'application/json'}
+        while True:
+            body = self._next()
+            if body is None:
+                break
+
+            start = time.time()
+            try:
+                conn.request('POST', '/search', body, headers)
+                response = conn.getresponse()
+                text = response.read()
+            except (httplib.HTTPException, IOError):
+                self.failures += 1
+                conn.close()
+                conn = httplib.HTTPConnection(self._host, self._port)
+                continue
+            self.latencies.append(time.time() - start)
+
+            if response.status != 200:
+                self.failures += 1
+                continue
+            reply = json.loads(text)
+            for record in reply.get('results', [reply]):
+                if record['error'] is not None:
+                    self.errors += 1
+        conn.close()
+
+def usage():
+    """
+    Print out the usage for this program
+    """
+
+    print 'Usage: %s [OPTIONS]' % (os.path.basename(sys.argv[0]))
+    print '    -u URL         Where the server is (default http://127.0.0.1:8080)'
+    print '    -b FILE        Queries to use, one per line (default: built-in samples)'
+    print '    -c N           Number of clients sending requests at once (default 8)'
+    print '    -n N           Number of requests to send (default 1000)'
+    print '    -q N           Queries per request (default 1, more sends arrays)'
+    print '    -h             Show this helpful message'
+
+def main():
+    """
+    The main program method
+    """
+
+    import json, urlparse
+    from benchmark import load_queries
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'u:b:c:n:q:h', ['url=', 'batch=', 'clients=', 'requests=',
+                                                                'queries=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(1)
+
+    url = 'http://127.0.0.1:8080'
+    batchFile = None
+    clients = 8
+    requests = 1000
+    perRequest = 1
+    try:
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                usage()
+                sys.exit()
+            elif o in ('-u', '--url'):
+                url = a
+            elif o in ('-b', '--batch'):
+                batchFile = a
+            elif o in ('-c', '--clients'):
+                clients = int(a)
+            elif o in ('-n', '--requests'):
+                requests = int(a)
+            elif o in ('-q', '--queries'):
+                perRequest = int(a)
+            else:
+                assert False, "unhandled option"
+    except ValueError, e:
+        print str(e)
+        usage()
+        sys.exit(1)
+
+    location = urlparse.urlparse(url)
+    queries = load_queries(batchFile)
+
+    # Build every request up front so the clients only time the server
+    bodies = []
+    for n in xrange(requests):
+        if perRequest == 1:
+            bodies.append(json.dumps({'query': queries[n % len(queries)]}))
+        else:
+            start = n * perRequest
+            bodies.append(json.dumps({'queries': [queries[(start + m) % len(queries)] for m in xrange(perRequest)]}))
+
+    counter = [0, threading.Lock()]
+    threads = [Client(location.hostname, location.port or 80, bodies, counter) for n in xrange(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.isAlive():
+            thread.join(1.0)
+    elapsed = time.time() - start
+
+    latencies = []
+    failures = 0
+    errors = 0
+    for thread in threads:
+        latencies.extend(thread.latencies)
+        failures += thread.failures
+        errors += thread.errors
+    latencies.sort()
+
+    print '%-20s %12d' % ('requests', len(latencies))
+    print '%-20s %12d' % ('failed requests', failures)
+    print '%-20s %12d' % ('failed searches', errors)
+    print '%-20s %12.1f' % ('requests/sec', len(latencies) / elapsed)
+    print '%-20s %12.1f' % ('searches/sec', len(latencies) * perRequest / elapsed)
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)):
+        print '%-20s %12.1f' % (name + ' ms', percentile(latencies, fraction) * 1000.0)
+
+if __name__ == '__main__':
+    main()
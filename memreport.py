@@ -0,0 +1,209 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# How much memory do N pre-forked workers really cost, compared to N
+# servers started on their own? Starts both kinds, runs the same searches
+# through every one of them, and reports what each process has all to
+# itself (USS) and its fair share of what's shared (PSS) from
+# /proc/PID/smaps. Linux only.
+#
+#     $> python memreport.py -n 4
+#     $> python memreport.py -n 4 -- --parser chart
+
+import sys, os, getopt, time, signal, subprocess, tempfile, shutil
+
+def memory(pid):
+    """
+    Get (rss, pss, uss) in kB for a process
+    """
+
+    totals = {'Rss': 0, 'Pss': 0, 'Private_Clean': 0, 'Private_Dirty': 0}
+    path = '/proc/%d/smaps_rollup' % (pid)
+    if not os.path.exists(path):
+        path = '/proc/%d/smaps' % (pid)
+    fh = open(path, 'r')
+    for line in fh:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].endswith(':') and totals.has_key(parts[0][:-1]):
+            totals[parts[0][:-1]] += int(parts[1])
+    fh.close()
+    return (totals['Rss'], totals['Pss'], totals['Private_Clean'] + totals['Private_Dirty'])
+
+def children(pid):
+    """
+    Get the pids of a process' children
+    """
+
+    found = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            fh = open('/proc/%s/stat' % (name), 'r')
+            stat = fh.read()
+            fh.close()
+        except IOError:
+            continue
+        # The command name is in parentheses and can have spaces in it
+        fields = stat[stat.rindex(')') + 2:].split()
+        if int(fields[1]) == pid:
+            found.append(int(name))
+    found.sort()
+    return found
+
+def start(path, args):
+    """
+    Start a server on a unix socket, returns once it's answering
+    """
+
+    from server import Client, ServerException
+
+    newman = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'newman.py')
+    proc = subprocess.Popen([sys.executable, newman, '--serve', path] + args)
+    for n in xrange(1200):
+        if proc.poll() is not None:
+            raise ServerException('server exited with status %d' % (proc.returncode))
+        try:
+            Client(path).close()
+            return proc
+        except ServerException:
+            time.sleep(0.1)
+    proc.kill()
+    raise ServerException('server never came up')
+
+def exercise(path, queries, rounds):
+    """
+    Send every query to a server rounds times, one connection per round
+    (so the pre-forked workers all get some of it)
+    """
+
+    from server import Client
+
+    for n in xrange(rounds):
+        client = Client(path)
+        try:
+            for query in queries:
+                client.request('search', query)
+        finally:
+            client.close()
+
+def stop(proc):
+    """
+    Shut a server down
+    """
+
+    proc.send_signal(signal.SIGTERM)
+    proc.wait()
+
+def report(name, pids):
+    """
+    Print out the memory for a bunch of processes, returns the total
+    (rss, pss, uss)
+    """
+
+    total = [0, 0, 0]
+    for label, pid in pids:
+        rss, pss, uss = memory(pid)
+        print '%-12s %-10s %10.1f %10.1f %10.1f' % (name, label, rss / 1024.0, pss / 1024.0, uss / 1024.0)
+        total[0] += rss
+        total[1] += pss
+        total[2] += uss
+    print '%-12s %-10s %10.1f %10.1f %10.1f' % (name, 'total', total[0] / 1024.0, total[1] / 1024.0,
+                                                total[2] / 1024.0)
+    return total
+
+def usage():
+    """
+    Print out the usage for this program
+    """
+
+    print 'Usage: %s [OPTIONS] [-- NEWMAN OPTIONS]' % (os.path.basename(sys.argv[0]))
+    print '    -n N           Number of workers / servers (default 4)'
+    print '    -b FILE        Queries to run through each one (default: built-in samples)'
+    print '    -r N           Times to run the queries (default 4)'
+    print '    -h             Show this helpful message'
+
+def main():
+    """
+    The main program method
+    """
+
+    from benchmark import load_queries
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'n:b:r:h', ['workers=', 'batch=', 'rounds=', 'help'])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(1)
+
+    workers = 4
+    batchFile = None
+    rounds = 4
+    try:
+        for o, a in opts:
+            if o in ('-h', '--help'):
+                usage()
+                sys.exit()
+            elif o in ('-n', '--workers'):
+                workers = int(a)
+            elif o in ('-b', '--batch'):
+                batchFile = a
+            elif o in ('-r', '--rounds'):
+                rounds = int(a)
+            else:
+                assert False, "unhandled option"
+    except ValueError, e:
+        print str(e)
+        usage()
+        sys.exit(1)
+
+    queries = load_queries(batchFile)
+    tmp = tempfile.mkdtemp(prefix = 'newman-mem-')
+    try:
+        print '%-12s %-10s %10s %10s %10s' % ('', '', 'RSS MB', 'PSS MB', 'USS MB')
+
+        # One master, N workers
+        path = os.path.join(tmp, 'prefork.sock')
+        proc = start(path, ['--prefork', str(workers)] + args)
+        try:
+            exercise(path, queries, rounds * workers)
+            pids = [('master', proc.pid)] + [('worker', pid) for pid in children(proc.pid)]
+            forked = report('prefork', pids)
+        finally:
+            stop(proc)
+
+        # N servers, each on its own
+        procs = []
+        try:
+            for n in xrange(workers):
+                path = os.path.join(tmp, 'alone%d.sock' % (n))
+                procs.append((path, start(path, args)))
+            for path, proc in procs:
+                exercise(path, queries, rounds)
+            alone = report('independent', [('server', proc.pid) for (path, proc) in procs])
+        finally:
+            for path, proc in procs:
+                stop(proc)
+
+        print ''
+        print '%d pre-forked workers use %.1f MB (PSS) where %d servers use %.1f MB, %.1fx less' % \
+            (workers, forked[1] / 1024.0, workers, alone[1] / 1024.0, float(alone[1]) / max(1, forked[1]))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
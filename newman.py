@@ -18,34 +18,182 @@
 
 import sys, os, getopt, config
 from search import *
+from engine import *
 from debug import *
 
-def batch(batchFile, vocabulary, grammar, generator):
+def open_batch(batchFile):
     """
-    Run a batch search, exit on the first error.
+    Open a batch file, '-' means stdin
     """
 
-    searches = []
+    if batchFile == '-':
+        return sys.stdin
+    return open(batchFile, 'r')
 
-    fh = open(batchFile, 'r')
-    for line in fh:
-        line = line.strip()
-        if len(line) > 0:
-            searches.append(line)
+def read_batch(batchFile):
+    """
+    Read a batch file, returns a list of (line number, search) tuples.
+    Dies if there's nothing in it.
+    """
+
+    from stream import read_queries
+
+    fh = open_batch(batchFile)
+    searches = list(read_queries(fh))
     fh.close()
 
     if len(searches) == 0:
         print "No searches to batch :("
         sys.exit(1)
 
-    for searchString in searches:
-        print '-'*80
-        print searchString.center(80)
-        print '-'* 80
-        if search(searchString, vocabulary, grammar, generator) != 0:
-            sys.exit(1)
+    return searches
+
+def batch_header(searchString):
+    """
+    Print the banner that goes above each batch search
+    """
+
+    print '-'*80
+    print searchString.center(80)
+    print '-'* 80
+
+def batch_failed(failures, total):
+    """
+    Report on the searches that failed in --keep-going mode
+    """
+
+    if len(failures) == 0:
+        return
+    print '='*80
+    print '%d of %d searches failed:' % (len(failures), total)
+    for lineno, searchString in failures:
+        print '    line %d: %s' % (lineno, searchString)
+    sys.exit(1)
+
+def batch(batchFile, engine, keepGoing = False):
+    """
+    Run a batch search, exit on the first error (unless keepGoing is set,
+    then just keep track of what failed).
+    """
+
+    searches = read_batch(batchFile)
+    failures = []
+
+    for lineno, searchString in searches:
+        batch_header(searchString)
+        result = engine.search(searchString)
+        print str(result)
+        if not result.ok():
+            if not keepGoing:
+                sys.exit(1)
+            failures.append((lineno, searchString))
         print ''
 
+    if get_debug():
+        debug('Result cache:', str(engine.cache()))
+    batch_failed(failures, len(searches))
+
+def _run_search(searchString):
+    """
+    Runs a single search in a worker process, returns (ok, output, stats)
+    where stats is whatever the worker profiled (see instrument.collect)
+    """
+
+    from stream import worker
+    from instrument import collect
+
+    result = worker().search(searchString)
+    return (result.ok(), str(result), collect())
+
+def parallel_batch(batchFile, jobs, keepGoing = False, setup = ()):
+    """
+    Same as batch, except the searches are spread across a pool of worker
+    processes (set up with stream.make_engine(*setup)). Results are still
+    printed in the same order as the file.
+    """
+
+    import multiprocessing
+    from stream import init_worker
+    from instrument import merge
+
+    searches = read_batch(batchFile)
+    failures = []
+
+    chunksize = max(1, min(64, len(searches) / (jobs * 4)))
+    pool = multiprocessing.Pool(jobs, init_worker, tuple(setup))
+    try:
+        results = pool.imap(_run_search, [s for (n, s) in searches], chunksize)
+        for (lineno, searchString), (ok, output, stats) in zip(searches, results):
+            merge(stats)
+            batch_header(searchString)
+            print output
+            if not ok:
+                if not keepGoing:
+                    pool.terminate()
+                    sys.exit(1)
+                failures.append((lineno, searchString))
+            print ''
+    finally:
+        pool.terminate()
+        pool.join()
+
+    batch_failed(failures, len(searches))
+
+def json_batch(batchFile, engine, jobs = 1, setup = ()):
+    """
+    Stream searches from a batch file (or stdin) to stdout as JSON lines.
+    Failed searches just get an error in their record, so this never stops
+    early. With jobs > 1 the engine is ignored (and may be None), the
+    worker processes set up their own.
+    """
+
+    from stream import read_queries, run_queries, run_queries_parallel, write_records
+
+    fh = open_batch(batchFile)
+    queries = read_queries(fh)
+    if jobs > 1:
+        records = run_queries_parallel(queries, jobs, setup)
+    else:
+        records = run_queries(queries, engine)
+
+    total, failed = write_records(records, sys.stdout)
+    fh.close()
+    if get_debug():
+        debug('%d searches, %d failed' % (total, failed))
+        if engine is not None:
+            debug('Result cache:', str(engine.cache()))
+
+def remote_batch(batchFile, path, keepGoing = False):
+    """
+    Same as batch, except the searches are sent off to a running server
+    """
+
+    from server import Client, ServerException
+
+    searches = read_batch(batchFile)
+    failures = []
+
+    try:
+        client = Client(path)
+        try:
+            for lineno, searchString in searches:
+                batch_header(searchString)
+                rc, lines = client.request('search', searchString)
+                for line in lines:
+                    print line
+                if rc != 0:
+                    if not keepGoing:
+                        sys.exit(1)
+                    failures.append((lineno, searchString))
+                print ''
+        finally:
+            client.close()
+    except ServerException, e:
+        print str(e)
+        sys.exit(1)
+
+    batch_failed(failures, len(searches))
+
 def usage():
     """
     Print out the usage for this program
@@ -54,8 +202,24 @@ def usage():
     print 'Usage: %s OPTIONS' % (os.path.basename(sys.argv[0]))
     print '    -s SEARCH      Search for a phrase'
     print '    -b FILE        Batch search using a file (one search per line)'
+    print '    -j N           Spread batch searches across N processes'
+    print '    -k             Keep going when a batch search fails'
+    print '    --json         Stream batch results as JSON lines (-b - reads stdin)'
     print '    -l WORD        Use wordnet to lookup a word'
     print '    -d             Enable debugging'
+    print '    --cache FILE   Remember WordNet lookups in FILE between runs'
+    print '    --results N    Remember the results of N reduced searches (default 1024, 0 = off)'
+    print '    --parser NAME  Parse with "nltk" (default) or "chart" (compiled, much faster)'
+    print '    --tokenizer NAME  Split searches with "regex" (default, hands anything odd to nltk) or "nltk"'
+    print '    --timeout SECS Give up on a search after SECS seconds'
+    print '    --degrade      When a search times out, settle for what the aliases alone say'
+    print '    --snapshot FILE  Load the configuration from FILE, (re)building it if needed'
+    print '    --profile      Print out where the time went (per stage) when done'
+    print '    --serve SOCK   Stay resident and answer requests on a unix socket'
+    print '    --http [HOST:]PORT  Stay resident and answer JSON searches over HTTP (-j N for N workers)'
+    print '    --prefork N    With --serve or --http, fork N workers that share one warmed up copy of everything'
+    print '    --reload SECS  With --serve or --http, check config.py for changes every SECS seconds and load them'
+    print '    -c SOCK        Send -s, -b, or -l off to a server instead'
     print '    -h             Show this helpful message'
 
 def main():
@@ -64,7 +228,9 @@ def main():
     """
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'b:s:l:dh', ['batch=', 'search=', 'lookup=', 'debug', 'help'])
+        opts, args = getopt.getopt(sys.argv[1:], 'b:s:l:c:j:kdh', ['batch=', 'search=', 'lookup=', 'connect=', 'serve=', 'http=', 'prefork=', 'reload=',
+                                                                 'cache=', 'results=', 'parser=', 'tokenizer=', 'timeout=', 'degrade', 'snapshot=', 'jobs=', 'keep-going', 'json', 'debug',
+                                                                 'profile', 'help'])
     except getopt.GetoptError, err:
         print str(err)
         usage()
@@ -73,6 +239,22 @@ def main():
     searchString = None
     batchFile = None
     lookupString = None
+    servePath = None
+    httpAddress = None
+    workers = 1
+    reloadInterval = None
+    connectPath = None
+    cachePath = None
+    cacheSize = 1024
+    parserName = 'nltk'
+    tokenizerName = 'regex'
+    timeout = None
+    degrade = False
+    snapshotPath = None
+    jobs = 1
+    keepGoing = False
+    jsonMode = False
+    profiling = False
 
     for o, a in opts:
         if o in ('-h', '--help'):
@@ -84,25 +266,162 @@ def main():
             searchString = a.strip()
         elif o in ('-l', '--lookup'):
             lookupString = a.strip()
+        elif o in ('-c', '--connect'):
+            connectPath = a
+        elif o == '--serve':
+            servePath = a
+        elif o == '--http':
+            from httpd import parse_address
+            try:
+                httpAddress = parse_address(a)
+            except ValueError:
+                print 'Invalid address: ' + a
+                usage()
+                sys.exit(1)
+        elif o == '--cache':
+            cachePath = a
+        elif o == '--results':
+            try:
+                cacheSize = int(a)
+            except ValueError:
+                cacheSize = -1
+            if cacheSize < 0:
+                print 'Invalid result cache size: ' + a
+                usage()
+                sys.exit(1)
+        elif o == '--snapshot':
+            snapshotPath = a
+        elif o == '--parser':
+            if a not in PARSERS:
+                print 'Unknown parser: ' + a
+                usage()
+                sys.exit(1)
+            parserName = a
+        elif o == '--timeout':
+            try:
+                timeout = float(a)
+            except ValueError:
+                timeout = -1
+            if timeout <= 0:
+                print 'Invalid timeout: ' + a
+                usage()
+                sys.exit(1)
+        elif o == '--degrade':
+            degrade = True
+        elif o == '--tokenizer':
+            if a not in TOKENIZERS:
+                print 'Unknown tokenizer: ' + a
+                usage()
+                sys.exit(1)
+            tokenizerName = a
+        elif o == '--prefork':
+            try:
+                workers = int(a)
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print 'Invalid number of workers: ' + a
+                usage()
+                sys.exit(1)
+        elif o == '--reload':
+            try:
+                reloadInterval = float(a)
+            except ValueError:
+                reloadInterval = -1
+            if reloadInterval <= 0:
+                print 'Invalid reload interval: ' + a
+                usage()
+                sys.exit(1)
+        elif o in ('-j', '--jobs'):
+            try:
+                jobs = int(a)
+            except ValueError:
+                jobs = 0
+            if jobs < 1:
+                print 'Invalid number of jobs: ' + a
+                usage()
+                sys.exit(1)
+        elif o in ('-k', '--keep-going'):
+            keepGoing = True
+        elif o == '--json':
+            jsonMode = True
         elif o in ('-d', '--debug'):
             set_debug(True)
+        elif o == '--profile':
+            profiling = True
         else:
             assert False, "unhandled option"
 
     if (searchString == None or len(searchString) == 0) and (lookupString == None or len(lookupString) == 0) \
-            and (batchFile == None or len(batchFile) == 0):
+            and (batchFile == None or len(batchFile) == 0) and (servePath == None or len(servePath) == 0) \
+            and httpAddress == None:
         usage()
         sys.exit(1)
 
-    debug('Initializing...')
-    vocabulary, grammar, generator = config.configure()
+    if reloadInterval != None and httpAddress != None and jobs > 1 and workers == 1:
+        print '--reload does not work with -j, try --prefork instead'
+        usage()
+        sys.exit(1)
 
-    if lookupString != None and len(lookupString) > 0:
-        sys.exit(lookup(lookupString, vocabulary))
-    elif batchFile != None and len(batchFile) > 0:
-        batch(batchFile, vocabulary, grammar, generator)
-    else:
-        sys.exit(search(searchString, vocabulary, grammar, generator))
+    if connectPath != None and len(connectPath) > 0:
+        # Let the server do all the heavy lifting
+        from server import remote
+        if lookupString != None and len(lookupString) > 0:
+            sys.exit(remote(connectPath, 'lookup', lookupString))
+        elif batchFile != None and len(batchFile) > 0:
+            remote_batch(batchFile, connectPath, keepGoing)
+        elif searchString != None and len(searchString) > 0:
+            sys.exit(remote(connectPath, 'search', searchString))
+        else:
+            usage()
+            sys.exit(1)
+        return
+
+    from stream import make_engine
+    from instrument import Profile, set_sink, get_sink
+    setup = (cachePath, cacheSize, parserName, snapshotPath, profiling, tokenizerName, timeout, degrade)
+
+    if profiling:
+        set_sink(Profile())
+
+    try:
+        if httpAddress != None and jobs > 1 and workers == 1:
+            # The workers configure themselves
+            from httpd import serve_http
+            sys.exit(serve_http(httpAddress, None, jobs, setup))
+
+        if batchFile != None and len(batchFile) > 0 and jobs > 1 and \
+                (lookupString == None or len(lookupString) == 0) and (servePath == None or len(servePath) == 0):
+            # The workers configure themselves
+            if jsonMode:
+                json_batch(batchFile, None, jobs, setup)
+            else:
+                parallel_batch(batchFile, jobs, keepGoing, setup)
+            return
+
+        debug('Initializing...')
+        engine = make_engine(*setup)
+
+        if httpAddress != None:
+            from httpd import serve_http
+            sys.exit(serve_http(httpAddress, engine, 1, setup, workers, reloadInterval))
+        elif servePath != None and len(servePath) > 0:
+            from server import serve
+            sys.exit(serve(servePath, engine, workers, reloadInterval))
+        elif lookupString != None and len(lookupString) > 0:
+            sys.exit(lookup(lookupString, engine.vocabulary()))
+        elif batchFile != None and len(batchFile) > 0 and jsonMode:
+            json_batch(batchFile, engine)
+        elif batchFile != None and len(batchFile) > 0:
+            batch(batchFile, engine, keepGoing)
+        else:
+            result = engine.search(searchString)
+            print str(result)
+            if not result.ok():
+                sys.exit(1)
+    finally:
+        if profiling:
+            get_sink().report(sys.stderr)
 
 if __name__ == '__main__':
     main()
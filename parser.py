@@ -15,6 +15,7 @@
 # limitations under the License.
 
 from generator import *
+from instrument import stage, count
 
 class ParserException(Exception):
     """
@@ -25,6 +26,202 @@ class ParserException(Exception):
     def __str__(self):
         return "Parse error: " + self.reason
 
+# The parsers a CompiledGrammar can use
+PARSERS = ('nltk', 'chart')
+
+class CompiledGrammar(object):
+    """
+    The grammar string generated by config.configure(), compiled into an
+    nltk CFG and chart parser exactly once. Reuse one of these for every
+    search instead of re-parsing the grammar each time.
+
+    Parsing is done with nltk's BottomUpChartParser, or with the
+    equivalent chart.CompiledChart (see use_parser).
+
+    Once frozen (config.configure() does that) the parser can't be
+    switched any more, use using() to get a copy with a different one.
+    """
+
+    # Never changes once this is set, see freeze
+    _frozen = False
+
+    def __init__(self, grammar, parser = 'nltk'):
+        """
+        Compile a grammar string
+        """
+
+        import nltk
+
+        self._source = grammar
+        try:
+            self._cfg = nltk.parse_cfg(grammar)
+        except ValueError, e:
+            raise ParserException(str(e))
+        self._parser = nltk.BottomUpChartParser(self._cfg)
+        self._chart = None
+        self._cyclic = None
+        self.use_parser(parser)
+
+    def __str__(self):
+        """
+        The original grammar string
+        """
+
+        return self._source
+
+    def source(self):
+        """
+        Get the original grammar string
+        """
+
+        return self._source
+
+    def cfg(self):
+        """
+        Get the compiled nltk grammar
+        """
+
+        return self._cfg
+
+    def use_parser(self, parser):
+        """
+        Pick the parser, one of PARSERS. 'chart' is a lot faster and
+        finds the exact same first tree, but only ever the first one.
+        """
+
+        from chart import CompiledChart
+
+        if parser not in PARSERS:
+            raise ParserException('unknown parser "' + parser + '"')
+        if self._frozen and parser != self._name:
+            raise ParserException('the grammar is frozen, see using()')
+        if parser == 'chart' and self._chart is None:
+            if self.cyclic():
+                raise ParserException('the chart parser can\'t handle empty productions or unary cycles')
+            self._chart = CompiledChart(self._cfg)
+        self._name = parser
+
+    def using(self, parser):
+        """
+        Get this grammar with a different parser (one of PARSERS), as a
+        copy which shares everything that's already been compiled. A
+        frozen grammar hands back a frozen copy.
+        """
+
+        import copy
+
+        if parser == self._name:
+            return self
+        other = copy.copy(self)
+        other._frozen = False
+        other.use_parser(parser)
+        other._frozen = self._frozen
+        return other
+
+    def freeze(self):
+        """
+        Work out everything that would otherwise be worked out the first
+        time it's needed (the cycles, the compiled chart) and don't let the
+        parser be switched from now on
+        """
+
+        from chart import CompiledChart
+
+        if self._frozen:
+            return
+        if not self.cyclic() and self._chart is None:
+            self._chart = CompiledChart(self._cfg)
+        self._frozen = True
+
+    def parser(self):
+        """
+        Get the name of the parser in use
+        """
+
+        return self._name
+
+    def compiled(self):
+        """
+        Get the chart.CompiledChart (whichever parser is in use), or None
+        if the grammar has cycles
+        """
+
+        from chart import CompiledChart
+
+        if self._chart is None and not self.cyclic():
+            self._chart = CompiledChart(self._cfg)
+        return self._chart
+
+    def cyclic(self):
+        """
+        Does the grammar have cycles (see chart.has_cycles)?
+        """
+
+        from chart import has_cycles
+
+        if self._cyclic is None:
+            self._cyclic = has_cycles(self._cfg)
+        return self._cyclic
+
+    def first_parse(self, parts, deadline = None, chart = None):
+        """
+        Parse a list of reduced words, returns nbest_parse(parts)[0] (or
+        None if there are no trees) without building any of the others.
+        Raises a TimeoutException if the deadline (a deadline.Deadline)
+        passes first.
+
+        If chart (a chart.IncrementalChart for this grammar) is given, it
+        gets caught up with parts and the tree is read off of it, so only
+        the words it hasn't seen yet get parsed. Same tree either way.
+        """
+
+        import nltk
+        from chart import first_tree, deadline_chart
+
+        if chart is not None:
+            chart.advance(parts, deadline)
+            return chart.parse()
+        if self._name == 'chart':
+            return self._chart.parse(parts, deadline)
+        if self.cyclic():
+            # Can't stop nltk in the middle of this one
+            trees = self.nbest_parse(parts)
+            if len(trees) == 0:
+                return None
+            return trees[0]
+
+        parser = self._parser
+        if deadline is not None:
+            parser = nltk.BottomUpChartParser(self._cfg, chart_class = deadline_chart(deadline))
+        chart = parser.chart_parse(parts)
+        count('chart edges', chart.num_edges())
+        return first_tree(chart, self._cfg.start())
+
+    def nbest_parse(self, parts):
+        """
+        Parse a list of reduced words, returns a list of trees
+        """
+
+        if self._name == 'chart':
+            tree = self._chart.parse(parts)
+            if tree is None:
+                return []
+            return [tree]
+
+        # Same as self._parser.nbest_parse(parts), except we get to see the chart
+        chart = self._parser.chart_parse(parts)
+        count('chart edges', chart.num_edges())
+        return chart.parses(self._cfg.start())
+
+def compile_grammar(grammar):
+    """
+    Compile a grammar string, unless it's already been compiled
+    """
+
+    if isinstance(grammar, CompiledGrammar):
+        return grammar
+    return CompiledGrammar(grammar)
+
 class ClassifierCollection(object):
     """
     Basically a big stack to collect the production symbols. Once all
@@ -32,9 +229,10 @@ class ClassifierCollection(object):
     classifier generator to get a list of classifier->value pairs.
     """
 
-    def __init__(self, generator):
+    def __init__(self, generator, deadline = None):
         """
-        Create a new one of these things
+        Create a new one of these things. If a deadline.Deadline is given,
+        finish() gives up (with a TimeoutException) once it passes.
         """
 
         self._classifiers = []
@@ -44,6 +242,7 @@ class ClassifierCollection(object):
         self._valid = 0
         self._text = []
         self._generator = generator
+        self._deadline = deadline
     
     def addtext(self, text):
         """
@@ -98,6 +297,15 @@ class ClassifierCollection(object):
         """
         return self._valid
 
+    def results(self):
+        """
+        Get the final classifier->value pairs, one list per "OR" group
+
+        [[('Classifier', 1.0), ('Classifier', -1.0)], [('Classifier', 1.0)]]
+        """
+
+        return [list(group) for group in self._final]
+
     def pprint(self):
         """
         Pretty print the final classifier->value pairs
@@ -105,19 +313,9 @@ class ClassifierCollection(object):
         ('Classifier' => Yes, 'Classifier' => No) | ('Classifier' => Yes)
         """
 
-        classifiers = []
-        for n in xrange(len(self._final)):
-            values = []
-            for (name, val) in self._final[n]:
-                if val > 0:
-                    pval = 'Yes'
-                else:
-                    pval = 'No'
-                values.append(name + ' => ' + pval)
-            classifiers.append(', '.join(values))
-        print '(' + ') | ('.join(classifiers) + ')'
+        print format_results(self._final)
 
-    def _gauntlet(self, cls, desperate):
+    def _gauntlet(self, cls, ids, reach, failed):
         """
         Hard to describe, easy to give an example:
 
@@ -144,27 +342,58 @@ class ClassifierCollection(object):
         and try again. If that fails, then clearly the program wasn't
         configured to handle that (or those) production symbol(s).
 
+        Starting over from the top after every pop would mean asking the
+        same questions over and over, so:
+
+        ids     The interned symbol ids for cls (see ClassifierGenerator)
+        reach   How far a mapping could possibly stretch from each position,
+                windows any longer than that are never even looked at
+        failed  Every (window, desperate) that already came back None. A
+                window's answer only depends on what's in it, so these stay
+                valid after a pop.
+
+        All of these are kept in step with cls when something gets popped.
         """
 
-        import config
+        if len(cls) == 0:
+            return None
+
+        top = max(reach)
+        probes = 0
+        for desperate in (False, True):
+            # Only single symbols get a desperate second chance
+            size = 1 if desperate else top
+            while size >= 1:
+                for n in xrange(0, len(cls) - size + 1):
+                    if reach[n] < size:
+                        continue
+                    key = self._generator.key(ids[n:size+n])
+                    if not self._generator.has_mapping(key):
+                        continue
+                    probe = (tuple(cls[n:size+n]), desperate)
+                    if probe in failed:
+                        continue
+
+                    # God I love this language
+                    prods = [ProductionSymbol(p[0], p[1]) for p in cls[n:size+n]]
+                    ret = self._generator.get_mapping_by_key(key, prods, desperate)
+                    probes += 1
+                    if ret != None:
+                        count('gauntlet probes', probes)
+                        del cls[n:size+n]
+                        del ids[n:size+n]
+                        del reach[n:size+n]
 
-        size = len(cls)
-        desperate = False
+                        # Only the symbols just before the hole can see
+                        # anything new
+                        for i in xrange(max(0, n - top), min(n, len(ids))):
+                            reach[i] = self._generator.reach(ids, i)
+                        return ret
 
-        while size >= 1:
-            end = len(cls) - size + 1
-            for n in range(0, end):
-                # God I love this language
-                prods = [ProductionSymbol(p[0], p[1]) for p in cls[n:size+n]]
-                ret = self._generator.get_mapping(prods, desperate)
-                if ret != None:
-                    del cls[n:size+n]
-                    return ret
-            size -= 1
-            if size == 0 and desperate == False:
-                size = 1
-                desperate = True
+                    failed.add(probe)
+                size -= 1
 
+        count('gauntlet probes', probes)
         return None
 
     def _convert(self, n):
@@ -172,17 +401,20 @@ class ClassifierCollection(object):
         Convert a list of production symbols to the classifier->value pairs
         """
         arr = self._final[n]
-        cls = self._classifiers[n]
+
+        # The gauntlet pops symbols off as it goes, so give it a copy
+        cls = list(self._classifiers[n])
+
+        ids = self._generator.symbol_ids(cls)
+        reach = [self._generator.reach(ids, i) for i in xrange(len(ids))]
+        failed = set()
 
         while True:
-            ret = self._gauntlet(cls, False)
+            if self._deadline is not None:
+                self._deadline.check('classifying')
+            ret = self._gauntlet(cls, ids, reach, failed)
             if ret == None:
                 if len(cls) > 0:
-                    ret = self._gauntlet(cls, True)
-                    if ret != None:
-                        for r in ret:
-                            arr.append(r)
-                        continue
                     remaining = '"' + '", "'.join([c[0] for c in cls]) + '"'
                     raise ParserException('Unable to meaningfully parse the production symbols: ' + remaining)
                 else:
@@ -234,6 +466,26 @@ class ClassifierCollection(object):
 
         self._final = classifiers
 
+def format_results(results):
+    """
+    Turn a list of lists of classifier->value pairs into something
+    a human can read
+
+    ('Classifier' => Yes, 'Classifier' => No) | ('Classifier' => Yes)
+    """
+
+    classifiers = []
+    for group in results:
+        values = []
+        for (name, val) in group:
+            if val > 0:
+                pval = 'Yes'
+            else:
+                pval = 'No'
+            values.append(name + ' => ' + pval)
+        classifiers.append(', '.join(values))
+    return '(' + ') | ('.join(classifiers) + ')'
+
 def rparse(tree, classifiers, negate, depth = 0):
     """
     Walk over a parse tree, and find (1) production symbols, and (2)
@@ -279,38 +531,42 @@ def rparse(tree, classifiers, negate, depth = 0):
 
     return rv
 
-def parse(wordlist, grammar, generator):
+def parse(wordlist, grammar, generator, deadline = None, chart = None):
     """
     Parse this thang. Call off to nltk's chart parser (which is
     the only one fast enough to parse the massive grammar). Only
-    use the top best tree. If no parse tree is found, the program
-    dies. The pass along the tree for actual symantic analysis,
-    and then print out the parse and we're done!
+    use the top best tree, and only ever build that one. If no parse
+    tree is found, the program dies. The pass along the tree for actual
+    symantic analysis, and hand back the finished ClassifierCollection.
+
+    The grammar should be a CompiledGrammar. A plain grammar string
+    still works, but then it gets compiled all over again every time.
+    If a deadline.Deadline is given and it passes before all of this is
+    done, a TimeoutException is raised. If a chart.IncrementalChart is
+    given, the tree comes from that instead (see first_parse).
     """
 
-    import nltk
-
     try:
-        gr = nltk.parse_cfg(grammar)
+        with stage('compile'):
+            parser = compile_grammar(grammar)
         parts = [w.reduced() for w in wordlist]
 
-        parser = nltk.BottomUpChartParser(gr)
-        trees = parser.nbest_parse(parts)
-
-        classifiers = ClassifierCollection(generator)
-        ct = 0
-        for tree in trees:
-            rparse(tree, classifiers, False)
-            ct += 1
-            break
+        with stage('chart'):
+            tree = parser.first_parse(parts, deadline, chart)
 
-        if ct == 0:
+        if tree is None:
             raise ParserException('No parse trees found')
 
-        classifiers.finish()
-        classifiers.pprint()
+        classifiers = ClassifierCollection(generator, deadline)
+        if deadline is not None:
+            deadline.check('parsing')
+        with stage('rparse'):
+            rparse(tree, classifiers, False)
+
+        with stage('finish'):
+            classifiers.finish()
 
     except ValueError, e:
         raise ParserException(str(e))
 
-    return 0
+    return classifiers
@@ -0,0 +1,121 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Pre-fork serving. The master process does all of the expensive setting
+# up exactly once (config.configure(), WordNet, the ancestors, ...), binds
+# the listening socket, and then forks off workers that all take turns
+# accepting connections on it. Whatever the master loaded is shared with
+# every worker copy-on-write, so N workers cost a lot less than N times
+# one process, and none of them have to warm up. The master just sits
+# there and replaces any worker that dies.
+
+import sys, os, time, signal
+from debug import *
+
+__all__ = ['freeze', 'prefork']
+
+# A worker that dies quicker than this is probably going to keep doing
+# that, so don't replace it right away
+_RESPAWN_DELAY = 1.0
+
+def freeze():
+    """
+    Get the heap ready for forking. Everything that's garbage now gets
+    collected before the fork instead of once in every worker, and where
+    python has gc.freeze() (3.7 and up) the collector is told to leave
+    everything that's left alone from now on, so it doesn't go and touch
+    (and copy) all of those shared pages.
+    """
+
+    import gc
+
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+def _worker(server, init):
+    """
+    Run in a freshly forked worker, never returns
+    """
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    status = 0
+    try:
+        try:
+            if init is not None:
+                init()
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except:
+            import traceback
+            traceback.print_exc()
+            status = 1
+    finally:
+        # Never run any of the master's cleanup
+        os._exit(status)
+
+def prefork(server, workers, init = None):
+    """
+    Fork workers processes that each call init() (if given) and then
+    server.serve_forever(), and keep that many of them running until
+    killed. The server (any SocketServer) has to be bound already.
+    """
+
+    children = {}   # pid -> when it was started
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _worker(server, init)
+        children[pid] = time.time()
+        if get_debug():
+            debug('Started worker', pid)
+
+    freeze()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for n in xrange(workers):
+            spawn()
+
+        while True:
+            try:
+                pid, status = os.wait()
+            except OSError:
+                continue
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+
+            if get_debug():
+                debug('Worker', pid, 'exited with status', status)
+            if time.time() - started < _RESPAWN_DELAY:
+                time.sleep(_RESPAWN_DELAY)
+            spawn()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children.keys():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in children.keys():
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+    return 0
@@ -0,0 +1,246 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Picks up changes to config.py without restarting. Running configure()
+# again is cheap; loading WordNet, resolving synsets, and refilling the
+# caches is what costs. So when config.py changes, the Reloader runs the
+# new configure() and holds the result up against what the running Engine
+# already has:
+#
+#     base words      the unchanged ones (and their WordNet synsets) are
+#                     kept, the alias tables are rebuilt around them
+#     grammar         kept if the text is the same, otherwise recompiled
+#     generator       kept if every mapping is the same
+#     reduction cache kept if no base word's synsets changed, otherwise
+#                     emptied
+#     result cache    kept if the grammar and generator were both kept
+#
+# A new Engine is built from all of that and swapped in. Searches that are
+# already running just finish on the old one.
+
+import sys, os, time, threading
+from debug import *
+
+__all__ = ['Reloader', 'merge']
+
+def _config_path():
+    """
+    Where config.py is
+    """
+
+    import config
+    return os.path.splitext(config.__file__)[0] + '.py'
+
+def _config_hash(path):
+    """
+    A hash of config.py's contents
+    """
+
+    import hashlib
+
+    fh = open(path, 'rb')
+    try:
+        return hashlib.sha1(fh.read()).hexdigest()
+    finally:
+        fh.close()
+
+def merge(engine, vocabulary, grammar, generator):
+    """
+    Build a new Engine out of a freshly configured vocabulary, grammar and
+    generator, keeping whatever engine already has that didn't change.
+    Returns (new engine, list of what happened to each piece), or (None,
+    ...) if nothing changed at all.
+    """
+
+    from word import Vocabulary
+    from cache import ReductionCache
+
+    notes = []
+
+    # Base words
+    old = engine.vocabulary()
+    unused = list(old)
+    basewords = []
+    kept = 0
+    for baseword in vocabulary:
+        for n, candidate in enumerate(unused):
+            if candidate.same_as(baseword):
+                baseword = unused.pop(n)
+                kept += 1
+                break
+        basewords.append(baseword)
+    if len(basewords) == len(old) and len([n for n in xrange(len(old)) if basewords[n] is not old[n]]) == 0:
+        vocabulary = old
+        notes.append('vocabulary kept')
+    else:
+        vocabulary = Vocabulary(basewords)
+        vocabulary.freeze()
+        notes.append('vocabulary rebuilt (%d of %d base words kept)' % (kept, len(basewords)))
+
+    # Grammar
+    if grammar.source() == engine.grammar().source():
+        grammar = engine.grammar()
+        notes.append('grammar kept')
+    else:
+        grammar = grammar.using(engine.grammar().parser())
+        notes.append('grammar recompiled')
+
+    # Generator
+    if generator.same_as(engine.generator()):
+        generator = engine.generator()
+        notes.append('generator kept')
+    else:
+        notes.append('generator rebuilt')
+
+    if vocabulary is old and grammar is engine.grammar() and generator is engine.generator():
+        return (None, notes)
+
+    # Reduction cache
+    cache = old.cache()
+    if vocabulary is not old and cache is not None:
+        if vocabulary.fingerprint() == old.fingerprint():
+            vocabulary.set_cache(cache)
+            notes.append('reduction cache kept')
+        else:
+            # Close the old one first, so that no search still running on
+            # the old engine can put anything stale in after it's emptied
+            cache.close()
+            vocabulary.set_cache(ReductionCache(cache.path(), vocabulary.fingerprint()))
+            notes.append('reduction cache emptied')
+
+    if grammar is engine.grammar() and generator is engine.generator():
+        notes.append('result cache kept')
+    else:
+        notes.append('result cache emptied')
+    return (engine.reconfigure(vocabulary, grammar, generator), notes)
+
+class Reloader(object):
+    """
+    Keeps an eye on config.py and swaps in a new Engine whenever it
+    changes
+    """
+
+    def __init__(self, engine, swapped = None, interval = 2.0):
+        """
+        Start from an Engine configured from the current config.py.
+        Whenever a new one gets swapped in, swapped(engine) is called (if
+        given). Once started, config.py is checked every interval seconds.
+        """
+
+        self._engine = engine
+        self._swapped = swapped
+        self._interval = interval
+        self._path = _config_path()
+        self._stat = self._signature()
+        self._hash = _config_hash(self._path)
+        self._lock = threading.Lock()
+        self._reloads = 0
+
+    def engine(self):
+        """
+        Get the current Engine. Hold on to it for the whole search, a
+        reload won't change it.
+        """
+
+        return self._engine
+
+    def reloads(self):
+        """
+        How many times a new Engine has been swapped in
+        """
+
+        return self._reloads
+
+    def _signature(self):
+        """
+        Something that changes whenever config.py does (most likely)
+        """
+
+        try:
+            st = os.stat(self._path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def changed(self):
+        """
+        Has config.py changed since it was last loaded? Only reads the
+        file if it looks like it has.
+        """
+
+        stat = self._signature()
+        if stat == self._stat:
+            return False
+        self._stat = stat
+        try:
+            return _config_hash(self._path) != self._hash
+        except IOError:
+            return False
+
+    def reload(self):
+        """
+        Load config.py again and swap in a new Engine if anything that
+        matters changed. Returns True if it did. Whatever config.py (or
+        configure()) raises is passed along, and the old Engine stays.
+        """
+
+        import config
+
+        with self._lock:
+            digest = _config_hash(self._path)
+            start = time.time()
+            reload(config)
+            configured = config.configure()
+            engine, notes = merge(self._engine, *configured)
+            self._hash = digest
+            if get_debug():
+                debug('Reloaded config.py in %.1fms:' % ((time.time() - start) * 1000.0), ', '.join(notes))
+            if engine is None:
+                return False
+
+            self._engine = engine
+            self._reloads += 1
+            if self._swapped is not None:
+                self._swapped(engine)
+            return True
+
+    def check(self):
+        """
+        Reload if config.py has changed. A config.py that doesn't work
+        gets complained about, and the old Engine stays.
+        """
+
+        if not self.changed():
+            return False
+        try:
+            return self.reload()
+        except Exception, e:
+            print >> sys.stderr, 'Unable to reload config.py: %s: %s' % (e.__class__.__name__, str(e))
+            return False
+
+    def start(self):
+        """
+        Check config.py every interval seconds on a thread of its own
+        """
+
+        def loop():
+            while True:
+                time.sleep(self._interval)
+                self.check()
+
+        thread = threading.Thread(target = loop, name = 'reloader')
+        thread.setDaemon(True)
+        thread.start()
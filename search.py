@@ -12,33 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import sys, os, getopt
+import sys, os, re, getopt, threading
 from word import *
 from parser import *
 from debug import *
-
-def run_preprocess(parts, vocabulary):
-    """
-    Find the first thing to replace, replace it, and return
-    """
-
-    size = len(parts)
-    while size >= 1:
-        end = len(parts) - size + 1
-        prange = range(0, end)
-        prange.reverse()
-        for n in prange:
-            pre = (' '.join(parts[n:size+n])).lower().rstrip(",.!\"'")
-            for vword in vocabulary:
-                if vword.word == pre:
-                    continue
-                if vword.is_alias(pre):
-                    del parts[n:size+n]
-                    parts.insert(n, vword.word)
-                    return True
-                    
-        size -= 1
-    return False
+from instrument import stage
+from deadline import *
 
 def preprocess(phrase, vocabulary):
     """
@@ -47,8 +26,7 @@ def preprocess(phrase, vocabulary):
 
     # Break it apart on whitespace
     parts = [p.strip() for p in phrase.split()]
-    while run_preprocess(parts, vocabulary):
-        pass
+    parts = vocabulary.rewrite(parts)
 
     # Split words on '-' boundaries, but only when they're not
     # known vocab words. 'Middle-aged' is an example of a known
@@ -58,12 +36,7 @@ def preprocess(phrase, vocabulary):
     for p in parts:
         tmp = p.split('-')
         if len(tmp) > 1:
-            baseword = False
-            for vword in vocabulary:
-                if p == vword.word:
-                    baseword = True
-                    break
-            if not baseword:
+            if not vocabulary.has_word(p):
                 for t in tmp:
                     preprocessed.append(t)
             else:
@@ -75,38 +48,213 @@ def preprocess(phrase, vocabulary):
     parts = [p for p in preprocessed if p is not None and len(p) > 0]
     return ' '.join(parts)
 
-def search(phrase, vocabulary, grammar, generator):
+class NltkTokenizer(object):
+    """
+    Splits a phrase into tokens the way nltk recommends: punkt for the
+    sentences, then the treebank tokenizer for the words. Everything gets
+    loaded up front so that it can be reused from one search to the next.
+    """
+
+    def __init__(self):
+        """
+        Load the punkt model
+        """
+
+        import nltk.data
+        from nltk.tokenize import TreebankWordTokenizer
+
+        self._sentences = nltk.data.load('tokenizers/punkt/english.pickle')
+        self._words = TreebankWordTokenizer()
+
+    def tokenize(self, phrase):
+        """
+        Get the list of tokens in a phrase
+        """
+
+        tokens = []
+        for sentenceStr in self._sentences.tokenize(phrase):
+            tokens.extend(self._words.tokenize(sentenceStr))
+        return tokens
+
+class RegexTokenizer(object):
+    """
+    A much faster stand-in for NltkTokenizer. Searches are one short
+    phrase made of words, hyphens, brackets and the odd "n't" or "'s", so
+    that's all this handles, and for those it comes up with exactly the
+    same tokens punkt + treebank would. Anything else (sentence punctuation,
+    quotes, "gonna", ...) gets handed to an NltkTokenizer, which is only
+    loaded the first time that happens.
+    """
+
+    # What a phrase has to be made of to be handled here. No '.', '?' or
+    # '!' means punkt would leave it as a single sentence.
+    _simple = re.compile(r"^[A-Za-z0-9 '()\[\]{}<>-]*$")
+
+    # Words treebank splits in two, and '--'
+    _special = re.compile(r"(?i)\b(cannot|d'ye|gimme|gonna|gotta|lemme|mor'n|wanna)\b|--")
+
+    # Each bracket is a token, everything between them and the spaces is a chunk
+    _chunks = re.compile(r"[()\[\]{}<>]|[^ ()\[\]{}<>]+")
+
+    # The only chunks with an apostrophe we know how to split
+    _contracted = re.compile(r"^([A-Za-z0-9-]+)(n't|N'T|'[sSmMdD]|'ll|'re|'ve|'LL|'RE|'VE|')$")
+
+    def __init__(self):
+        """
+        Nothing to load (yet)
+        """
+
+        self._fallback = None
+        self._lock = threading.Lock()
+
+    def fallback(self):
+        """
+        Get the NltkTokenizer, loading it the first time around
+        """
+
+        if self._fallback is None:
+            with self._lock:
+                if self._fallback is None:
+                    self._fallback = NltkTokenizer()
+        return self._fallback
+
+    def tokenize(self, phrase):
+        """
+        Get the list of tokens in a phrase
+        """
+
+        if self._simple.match(phrase) is None or self._special.search(phrase) is not None:
+            return self.fallback().tokenize(phrase)
+
+        tokens = []
+        for chunk in self._chunks.findall(phrase):
+            if "'" in chunk:
+                match = self._contracted.match(chunk)
+                if match is None:
+                    return self.fallback().tokenize(phrase)
+                tokens.extend(match.groups())
+            else:
+                tokens.append(chunk)
+        return tokens
+
+# The tokenizers an Engine can use
+TOKENIZERS = ('regex', 'nltk')
+
+def make_tokenizer(name):
+    """
+    Get a new tokenizer by name, one of TOKENIZERS
+    """
+
+    if name == 'regex':
+        return RegexTokenizer()
+    elif name == 'nltk':
+        return NltkTokenizer()
+    raise SearchException('unknown tokenizer "' + name + '"')
+
+class SearchException(Exception):
+    """
+    The search couldn't even make it to the parser
+    """
+    def __init__(self, reason):
+        self.reason = reason
+    def __str__(self):
+        return self.reason
+
+class UnknownWordsException(SearchException):
+    """
+    One or more of the words in the search are a mystery, even to wordnet
+    """
+    def __init__(self, words):
+        SearchException.__init__(self, 'Error: unknown words: "' + '", "'.join(words) + '"')
+        self.words = words
+
+def _reduce(token, vocabulary, deadline, memo):
+    """
+    Make a Word out of a token, or raise whatever Word does. If memo (a
+    dictionary) is given, every token only gets looked at once: the Word,
+    or the NonWordException or UnknownWordException, is kept in there.
+    """
+
+    if memo is not None and memo.has_key(token):
+        word = memo[token]
+        if isinstance(word, Exception):
+            raise word
+        return word
+
+    try:
+        word = Word(token, vocabulary, False, deadline)
+    except (NonWordException, UnknownWordException), e:
+        if memo is not None:
+            memo[token] = e
+        raise
+    if memo is not None:
+        memo[token] = word
+    return word
+
+def classify(phrase, vocabulary, grammar, generator, tokenizer = None, results = None, deadline = None,
+             aliasesOnly = False, memo = None, known = None, chart = None):
     """
     The actual search method. Tokenizes a string, simplifies the words, and passes
-    them along to the parser.
+    them along to the parser. Returns the finished ClassifierCollection, or raises
+    SearchException, ParserException, or UnsupportedSearch.
+
+    If results (a ResultCache) is given, the parser only gets involved the first
+    time a reduced sequence of words shows up.
+
+    If a deadline (a deadline.Deadline) is given, every stage keeps an eye on it
+    and a TimeoutException is raised once it passes. With aliasesOnly set, words
+    that would need WordNet to be reduced are simply skipped, which is a whole
+    lot cheaper (and a whole lot less accurate).
+
+    The last three are for searching the same thing over and over as it gets
+    typed (see engine.Session). memo is a dictionary of the tokens reduced
+    so far (see _reduce), known a list that gets filled in with the reduced
+    words up to the first unknown one, and chart a chart.IncrementalChart
+    the words get parsed with (see parse).
     """
 
-    orig = ' '.join([o for o in phrase.split() if len(o) > 0])
-    debug('Original: ' + orig)
+    # No time at all for WordNet, and these aren't the real results
+    reducing = deadline
+    if aliasesOnly:
+        reducing = Deadline(0)
+        results = None
+
+    if get_debug():
+        debug('Original: ' + ' '.join([o for o in phrase.split() if len(o) > 0]))
 
     # Preprocess this thing. Could get messy.
-    phrase = preprocess(phrase, vocabulary)
+    with stage('preprocess'):
+        preprocessed = preprocess(phrase, vocabulary)
 
     # Because I'm a cautious bastard
-    debug('Preprocessed: ' + phrase)
-    if len(phrase) == 0 and len(orig) > 0:
-        print "Preprocessing has destroyed everything :("
-        sys.exit(1)
+    if get_debug():
+        debug('Preprocessed: ' + preprocessed)
+    if len(preprocessed) == 0 and len(phrase.split()) > 0:
+        raise SearchException("Preprocessing has destroyed everything :(")
+    phrase = preprocessed
+
+    if tokenizer is None:
+        tokenizer = RegexTokenizer()
 
-    import nltk
-    from nltk.tokenize import sent_tokenize
-    from nltk.tokenize import word_tokenize
+    with stage('tokenize'):
+        tokens = tokenizer.tokenize(phrase)
+    if deadline is not None:
+        deadline.check('tokenizing')
 
     unknowns = [] # Holds the indices of unknown words
     words = []
     toklist = []
-    for i, sentenceStr in enumerate(sent_tokenize(phrase)):
-        tokens = word_tokenize(sentenceStr)
+    with stage('reduce'):
         for token in tokens:
             if token:
                 toklist.append(token)
                 try:
-                    words.append((token, Word(token, vocabulary)))
+                    words.append((token, _reduce(token, vocabulary, reducing, memo)))
+                except TimeoutException:
+                    if not aliasesOnly:
+                        raise
+                    debug('Skipping non-alias:', token)
+                    words.append((token, None))
                 except NonWordException:
                     debug('Skipping non-word:', token)
                     words.append((token, None))
@@ -114,24 +262,64 @@ def search(phrase, vocabulary, grammar, generator):
                     words.append((token, None))
                     unknowns.append(len(words) - 1)
 
-    debug('Tokens: ' + "'" + "', '".join(toklist) + "'")
+    if get_debug():
+        debug('Tokens: ' + "'" + "', '".join(toklist) + "'")
+
+    if known is not None:
+        # Only up to the first unknown word, that one's most likely still
+        # being typed
+        upto = len(words)
+        if len(unknowns) > 0:
+            upto = unknowns[0]
+        known[:] = [w[1].reduced() for w in words[:upto] if w[1] != None]
 
     if len(unknowns) > 0:
-        uwords = [words[idx][0] for idx in unknowns]
-        print 'Error: unknown words:', '"' + '", "'.join(uwords) + '"'
-        return 1
+        raise UnknownWordsException([words[idx][0] for idx in unknowns])
 
     words = [w[1] for w in words if w[1] != None]
-    debug("Input:", ' '.join([w.original() for w in words]))
-    debug("Reduced:", ' '.join([w.reduced() for w in words]))
+    if get_debug():
+        debug("Input:", ' '.join([w.original() for w in words]))
+        debug("Reduced:", ' '.join([w.reduced() for w in words]))
 
     # We now have a list of words in reduced form, let's parse them
+    if results is None:
+        return parse(words, grammar, generator, deadline, chart)
+
+    key = tuple([w.reduced() for w in words])
+    entry = results.get(key)
+    if entry is None:
+        try:
+            entry = parse(words, grammar, generator, deadline, chart)
+        except (ParserException, UnsupportedSearch), e:
+            entry = e
+        results.put(key, entry)
+    else:
+        debug('Found in result cache')
+
+    if isinstance(entry, Exception):
+        raise entry
+    return entry
+
+def search(phrase, vocabulary, grammar, generator, timeout = None):
+    """
+    Search for a phrase and print out the classifiers. Returns 0 on success.
+    If it takes longer than timeout seconds, it gives up.
+    """
+
+    deadline = None
+    if timeout is not None:
+        deadline = Deadline(timeout)
+
     try:
-        results = parse(words, grammar, generator)
-    except ParserException, e:
+        classifiers = classify(phrase, vocabulary, grammar, generator, None, None, deadline)
+    except (UnknownWordsException, ParserException, TimeoutException), e:
         print str(e)
         return 1
+    except SearchException, e:
+        print str(e)
+        sys.exit(1)
 
+    classifiers.pprint()
     return 0
 
 def lookup(word, vocabulary):
@@ -173,3 +361,51 @@ def lookup(word, vocabulary):
         return 1
 
     return 0
+
+class _Capture(object):
+    """
+    Collects everything that gets printed
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, text):
+        self._chunks.append(text)
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        text = ''.join(self._chunks)
+        if len(text) == 0:
+            return []
+        return text.rstrip('\n').split('\n')
+
+def captured(func, *args):
+    """
+    Call search or lookup with stdout captured, returns (exit code, output
+    lines). Anything that would normally kill the program (sys.exit, an
+    UnsupportedSearch, ...) just becomes an exit code of 1.
+    """
+
+    capture = _Capture()
+    stdout = sys.stdout
+    sys.stdout = capture
+    try:
+        try:
+            rc = func(*args)
+        except SystemExit, e:
+            rc = e.code
+            if rc is None:
+                rc = 0
+            elif not isinstance(rc, int):
+                print rc
+                rc = 1
+        except Exception, e:
+            print 'Error:', str(e)
+            rc = 1
+    finally:
+        sys.stdout = stdout
+
+    return (rc, capture.lines())
@@ -0,0 +1,208 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# A tiny line based protocol over a unix domain socket. The client sends
+# one request per line:
+#
+#     search grinning chinese dude
+#     lookup dude
+#
+# and for each one the server answers with a header line holding the exit
+# code and the number of output lines, followed by that many lines:
+#
+#     0 1
+#     (Asian => Yes, Male => Yes, Smiling => Yes)
+#
+# Any number of requests can be sent over the same connection.
+
+import sys, os, socket, SocketServer
+from search import *
+from engine import *
+from debug import *
+
+class ServerException(Exception):
+    """
+    The server misbehaved, or couldn't be reached
+    """
+    def __init__(self, reason):
+        self.reason = reason
+    def __str__(self):
+        return "Server error: " + self.reason
+
+def handle(line, engine):
+    """
+    Run a single request line, returns (exit code, output lines)
+    """
+
+    line = line.strip()
+    if ' ' in line:
+        command, argument = line.split(' ', 1)
+    else:
+        command, argument = line, ''
+    argument = argument.strip()
+
+    if len(argument) == 0 or command not in ('search', 'lookup'):
+        return (2, ['Error: bad request: "' + line + '"'])
+
+    if command == 'search':
+        result = engine.search(argument)
+        return (0 if result.ok() else 1, str(result).split('\n'))
+    return captured(lookup, argument, engine.vocabulary())
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """
+    Answers requests, one per line, until the client hangs up
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            rc, lines = handle(line, self.server.engine)
+            if get_debug():
+                debug('Request:', line.strip(), '=>', rc)
+            out = ['%d %d' % (rc, len(lines))] + lines
+            self.wfile.write('\n'.join(out) + '\n')
+            self.wfile.flush()
+
+class _Server(SocketServer.UnixStreamServer):
+    """
+    Requests are answered one at a time, so whatever the search pipeline
+    has warmed up (wordnet, caches, ...) stays warm for everybody.
+    """
+
+    def __init__(self, path, engine):
+        self.engine = engine
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+
+def serve(path, engine, workers = 1, reloadInterval = None):
+    """
+    Listen on a unix domain socket until killed. With workers > 1 the
+    engine gets warmed up, and that many pre-forked workers share it
+    (see prefork). With a reloadInterval, config.py gets checked for
+    changes that often (in every worker), see reloader.
+    """
+
+    import stat, signal
+
+    # Clean up after a server that didn't exit cleanly
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise ServerException('"' + path + '" exists and is not a socket')
+        os.unlink(path)
+
+    server = _Server(path, engine)
+    reloader = None
+    if reloadInterval is not None:
+        from reloader import Reloader
+
+        # Requests already being answered keep the engine they started with
+        def swapped(engine):
+            server.engine = engine
+        reloader = Reloader(engine, swapped, reloadInterval)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    debug('Listening on', path)
+    try:
+        if workers > 1:
+            from prefork import prefork
+            engine.warm()
+
+            def init():
+                engine.after_fork()
+                if reloader is not None:
+                    reloader.start()
+            prefork(server, workers, init)
+        else:
+            if reloader is not None:
+                reloader.start()
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+    return 0
+
+class Client(object):
+    """
+    Talks to a running server. Keeps the connection open so that many
+    requests can be sent without reconnecting.
+    """
+
+    def __init__(self, path):
+        """
+        Connect to the server listening on path
+        """
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(path)
+        except socket.error, e:
+            self._sock.close()
+            raise ServerException('unable to connect to "' + path + '": ' + str(e))
+        self._rfile = self._sock.makefile('rb')
+        self._wfile = self._sock.makefile('wb')
+
+    def request(self, command, argument):
+        """
+        Send a request, returns (exit code, output lines)
+        """
+
+        argument = ' '.join(argument.split())
+        self._wfile.write(command + ' ' + argument + '\n')
+        self._wfile.flush()
+
+        header = self._rfile.readline()
+        try:
+            rc, count = [int(h) for h in header.split()]
+        except ValueError:
+            raise ServerException('bad response: "' + header.strip() + '"')
+
+        lines = []
+        for n in xrange(count):
+            lines.append(self._rfile.readline().rstrip('\n'))
+        return (rc, lines)
+
+    def close(self):
+        """
+        Hang up
+        """
+
+        self._rfile.close()
+        self._wfile.close()
+        self._sock.close()
+
+def remote(path, command, argument):
+    """
+    Send a single request to the server and print out whatever it says
+    """
+
+    try:
+        client = Client(path)
+        try:
+            rc, lines = client.request(command, argument)
+        finally:
+            client.close()
+    except ServerException, e:
+        print str(e)
+        return 1
+
+    for line in lines:
+        print line
+    return rc
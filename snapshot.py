@@ -0,0 +1,185 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Saves whatever config.configure() builds (vocabulary, compiled grammar,
+# classifier generator) to a file, so that the next run can just load it.
+# The file starts with a single header line:
+#
+#     NEWMAN-SNAPSHOT <fingerprint>
+#
+# followed by a pickle. The fingerprint covers the snapshot format, the
+# python version, the nltk version (its grammar objects are in there
+# too), the WordNet version, and the source of config.py (plus the
+# modules whose objects end up in the pickle), so changing any of those
+# makes the snapshot stale and it simply gets rebuilt.
+
+import sys, os
+from debug import *
+
+__all__ = ['SnapshotException', 'configure', 'load_snapshot', 'save_snapshot', 'fingerprint']
+
+# Bump this whenever the pickled objects change in a way the module
+# sources wouldn't catch
+SNAPSHOT_VERSION = 1
+
+_header = 'NEWMAN-SNAPSHOT'
+
+# Everything that goes into the pickle is defined in one of these
+_modules = ('config', 'word', 'parser', 'chart', 'generator', 'snapshot')
+
+class SnapshotException(Exception):
+    """
+    A snapshot couldn't be written
+    """
+    def __init__(self, reason):
+        self.reason = reason
+    def __str__(self):
+        return "Snapshot error: " + self.reason
+
+def fingerprint():
+    """
+    A hash of everything a snapshot depends on
+    """
+
+    import hashlib, nltk
+    from word import wordnet_version
+
+    sha = hashlib.sha1()
+    sha.update('snapshot %d\n' % (SNAPSHOT_VERSION))
+    sha.update('python ' + sys.version + '\n')
+    sha.update('nltk ' + str(getattr(nltk, '__version__', None)) + '\n')
+    sha.update('wordnet ' + str(wordnet_version()) + '\n')
+    for name in _modules:
+        module = __import__(name)
+        path = os.path.splitext(module.__file__)[0] + '.py'
+        fh = open(path, 'rb')
+        sha.update(name + ' ' + fh.read() + '\n')
+        fh.close()
+    return sha.hexdigest()
+
+def _function(code, module, name, defaults, closure):
+    """
+    Put a function back together (see _Pickler.save_function)
+    """
+
+    import marshal, types
+
+    cells = tuple([(lambda value: lambda: value)(c).func_closure[0] for c in closure])
+    return types.FunctionType(marshal.loads(code), __import__(module).__dict__, name, defaults, cells or None)
+
+def _pickler(fh):
+    """
+    Get a pickler that can cope with the lambdas in config.py. Regular
+    functions are saved by name as usual, anonymous ones get their code
+    marshalled (fine, since the python version is part of the fingerprint).
+    """
+
+    import pickle, marshal, types
+
+    class _Pickler(pickle.Pickler):
+        dispatch = pickle.Pickler.dispatch.copy()
+
+        def save_function(self, obj):
+            try:
+                return self.save_global(obj)
+            except pickle.PicklingError:
+                pass
+            closure = [cell.cell_contents for cell in (obj.func_closure or ())]
+            self.save_reduce(_function, (marshal.dumps(obj.func_code), obj.__module__, obj.func_name,
+                                         obj.func_defaults, closure), obj = obj)
+
+        dispatch[types.FunctionType] = save_function
+
+    return _Pickler(fh, pickle.HIGHEST_PROTOCOL)
+
+def save_snapshot(path, vocabulary, grammar, generator):
+    """
+    Write a snapshot. The file is swapped in whole, so anybody reading
+    it at the same time sees either the old one or the new one.
+    """
+
+    import tempfile
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix = '.snapshot-', dir = directory)
+    try:
+        fh = os.fdopen(fd, 'wb')
+        try:
+            fh.write(_header + ' ' + fingerprint() + '\n')
+            _pickler(fh).dump((vocabulary, grammar, generator))
+        finally:
+            fh.close()
+
+        # mkstemp makes it private, it doesn't need to be
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0666 & ~umask)
+        os.rename(tmp, path)
+    except Exception, e:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise SnapshotException('unable to write "' + path + '": ' + str(e))
+
+def load_snapshot(path):
+    """
+    Read a snapshot, returns (vocabulary, grammar, generator), or None
+    if there isn't one or it's stale or broken
+    """
+
+    import cPickle
+
+    try:
+        fh = open(path, 'rb')
+    except IOError:
+        return None
+
+    try:
+        header = fh.readline().split()
+        if len(header) != 2 or header[0] != _header:
+            debug('Not a snapshot:', path)
+            return None
+        if header[1] != fingerprint():
+            debug('Snapshot is stale:', path)
+            return None
+        try:
+            return cPickle.load(fh)
+        except Exception, e:
+            debug('Unable to load snapshot:', str(e))
+            return None
+    finally:
+        fh.close()
+
+def configure(path):
+    """
+    Same as config.configure(), except the result comes from (and goes
+    into) a snapshot file whenever possible
+    """
+
+    import config
+
+    configured = load_snapshot(path)
+    if configured is not None:
+        debug('Loaded snapshot', path)
+        return configured
+
+    configured = config.configure()
+    try:
+        save_snapshot(path, *configured)
+        debug('Saved snapshot', path)
+    except SnapshotException, e:
+        # Oh well, next time
+        debug(str(e))
+    return configured
@@ -0,0 +1,177 @@
+# NEWMAN: Natural English With Mutating Abridged Nouns
+#
+# Copyright 2010 Chris Eberle <eberle1080@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Streaming batch searches, one JSON object per line:
+#
+#   {"line": 1, "query": "grinning chinese dude", "error": null,
+#    "groups": [[{"classifier": "Asian", "value": 1.0}, ...]]}
+#
+# Every stage is a generator, so nothing is ever read further ahead than
+# the current chunk no matter how big the input is.
+
+import sys, itertools
+from engine import *
+from debug import *
+
+def read_queries(fh):
+    """
+    Lazily read searches from a file, yields (line number, search). Lines
+    that aren't UTF-8 get whatever isn't swapped for U+FFFD, so that one
+    bad line can't take the JSON down with it.
+    """
+
+    for n, line in enumerate(fh):
+        line = line.decode('utf-8', 'replace').encode('utf-8').strip()
+        if len(line) > 0:
+            yield (n + 1, line)
+
+def result_record(lineno, result):
+    """
+    Turn a SearchResult into a dictionary (with no line number at all if
+    lineno is None)
+    """
+
+    record = {'query': result.phrase(), 'groups': None, 'error': None}
+    if lineno is not None:
+        record['line'] = lineno
+    if result.groups() is not None:
+        # Failed searches only have groups when they were degraded
+        record['groups'] = [[{'classifier': name, 'value': value} for (name, value) in group]
+                            for group in result.groups()]
+    if not result.ok():
+        error = result.error()
+        record['error'] = {'type': error.__class__.__name__, 'message': str(error)}
+    return record
+
+def run_queries(queries, engine):
+    """
+    Yields a result record for every (line number, search)
+    """
+
+    for lineno, query in queries:
+        yield result_record(lineno, engine.search(query))
+
+def write_records(records, out, chunk = 64):
+    """
+    Write out records as JSON lines, flushing every chunk records.
+    Returns (total, failed).
+    """
+
+    import json
+
+    total = 0
+    failed = 0
+    buf = []
+    for record in records:
+        total += 1
+        if record['error'] is not None:
+            failed += 1
+        try:
+            buf.append(json.dumps(record, sort_keys = True))
+        except UnicodeDecodeError:
+            # Some bytes that aren't UTF-8 got in anyway, better mangled
+            # than not at all
+            buf.append(json.dumps(record, sort_keys = True, encoding = 'latin-1'))
+        if len(buf) >= chunk:
+            out.write('\n'.join(buf) + '\n')
+            out.flush()
+            buf = []
+
+    if len(buf) > 0:
+        out.write('\n'.join(buf) + '\n')
+        out.flush()
+
+    return (total, failed)
+
+def make_engine(cachePath = None, cacheSize = 1024, parserName = 'nltk', snapshotPath = None, profiling = False,
+                tokenizerName = 'regex', timeout = None, degrade = False):
+    """
+    Configure an Engine the way the command line asked for: straight from
+    config.py or from a snapshot, with or without a reduction cache, and
+    so on
+    """
+
+    import config
+    from cache import open_cache
+    from instrument import Profile, set_sink, get_sink
+
+    if profiling and get_sink() is None:
+        set_sink(Profile())
+
+    if snapshotPath is not None and len(snapshotPath) > 0:
+        import snapshot
+        vocabulary, grammar, generator = snapshot.configure(snapshotPath)
+    else:
+        vocabulary, grammar, generator = config.configure()
+    grammar = grammar.using(parserName)
+
+    engine = Engine(vocabulary, grammar, generator, cacheSize, tokenizerName, timeout, degrade)
+    open_cache(engine.vocabulary(), cachePath)
+    return engine
+
+# Each worker process gets its own Engine
+_worker = None
+
+def init_worker(*setup):
+    """
+    Pool initializer, sets up an Engine once in every worker process.
+    Takes the same arguments as make_engine.
+    """
+
+    global _worker
+    _worker = make_engine(*setup)
+
+def worker():
+    """
+    Get the Engine set up by init_worker
+    """
+
+    return _worker
+
+def _run_record(item):
+    """
+    Runs a single search in a worker process, returns the record along
+    with whatever the worker profiled (see instrument.collect)
+    """
+
+    from instrument import collect
+
+    record = result_record(item[0], _worker.search(item[1]))
+    return (record, collect())
+
+def run_queries_parallel(queries, jobs, setup = (), chunk = 64):
+    """
+    Same as run_queries, except the work is spread across a pool of
+    processes, each one set up with make_engine(*setup). Only chunk * jobs
+    searches are ever in flight at a time, and results come out in the
+    same order they went in.
+    """
+
+    import multiprocessing
+    from instrument import merge
+
+    pool = multiprocessing.Pool(jobs, init_worker, tuple(setup))
+    try:
+        while True:
+            window = list(itertools.islice(queries, chunk * jobs))
+            if len(window) == 0:
+                break
+            for record, stats in pool.map(_run_record, window, chunk):
+                merge(stats)
+                yield record
+    finally:
+        pool.terminate()
+        pool.join()
@@ -14,6 +14,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+from instrument import count
+
 class NonWordException(Exception):
     """
     A word which is not
@@ -32,28 +35,112 @@ class UnknownWordException(Exception):
     def __str__(self):
         return str(self.parameter)
 
+class VocabularyException(Exception):
+    """
+    Somebody tried to change a frozen vocabulary
+    """
+    def __init__(self, reason):
+        self.reason = reason
+    def __str__(self):
+        return "Vocabulary error: " + self.reason
+
+# nltk's WordNet reader (and _sense_index) seek around in files which are
+# shared by everybody, so only one thread at a time gets to ask it things
+_wordnet = threading.RLock()
+
+# Opened the first time a lemma key gets looked up
+_sense_index = None
+
+# The digit after the '%' in a lemma key
+_key_pos = {1: 'n', 2: 'v', 3: 'a', 4: 'r', 5: 's'}
+
+def wordnet_path():
+    """
+    Get the nltk path pointer to the WordNet corpus files
+    """
+
+    import nltk.data
+    return nltk.data.find('corpora/wordnet')
+
+def wordnet_version():
+    """
+    Get the WordNet version straight out of the data files, the same
+    way nltk does, without loading all of WordNet to do it
+    """
+
+    import re
+
+    fh = wordnet_path().join('data.adj').open()
+    try:
+        for line in fh:
+            match = re.search(r'WordNet (\d+\.\d+) Copyright', line)
+            if match is not None:
+                return match.group(1)
+    finally:
+        fh.close()
+    return None
+
+def synset_ref(key):
+    """
+    Find the synset a lemma key (i.e. 'man%1:18:00::') belongs to, as a
+    (pos, offset) pair. Reads WordNet's index.sense directly, the same
+    way wn.lemma_from_key does, except without loading all of WordNet
+    first. None if there's no such key.
+    """
+
+    from nltk.util import binary_search_file
+
+    global _sense_index
+
+    key = key.strip().lower()
+    try:
+        pos = _key_pos[int(key.split('%', 1)[1].split(':', 1)[0])]
+    except (IndexError, KeyError, ValueError):
+        return None
+
+    with _wordnet:
+        if _sense_index is None:
+            _sense_index = wordnet_path().join('index.sense').open()
+        line = binary_search_file(_sense_index, key)
+    if not line:
+        return None
+    return (pos, int(line.split()[1]))
+
 class BaseWord(object):
     """
     Represents a base word, or more specifically a word which our grammar will support
+
+    The synsets are kept as (pos, offset) pairs and only turned into real
+    WordNet synsets the first time somebody asks for them, so that searches
+    which never leave the vocabulary never have to load WordNet at all.
     """
 
+    # Never changes once this is set, see freeze
+    _frozen = False
+
     def __init__(self, word, production = None, synsets = None, aliases = None):
         """
-        Create a new base word
+        Create a new base word. Synsets can be WordNet synsets or
+        (pos, offset) pairs (see synset_ref).
         """
 
         self.word = word.strip().lower()
         self.production = production
-        self.synsets = []
         self.aliases = []
+        self._refs = []
+        self._synsets = None
 
         if synsets is not None:
-            if isinstance(synsets, (list, tuple)):
-                for synset in synsets:
-                    if synset is not None:
-                        self.synsets.append(synset)
-            else:
-                self.synsets.append(synsets)
+            if not isinstance(synsets, (list, tuple)) or \
+                    (len(synsets) > 0 and isinstance(synsets[0], basestring)):
+                # Just the one
+                synsets = [synsets]
+            for synset in synsets:
+                if synset is None:
+                    continue
+                if not isinstance(synset, tuple):
+                    synset = (synset.pos, synset.offset)
+                self._refs.append(synset)
 
         if aliases is not None:
             if isinstance(aliases, (list, tuple)):
@@ -81,6 +168,8 @@ class BaseWord(object):
         """
 
         import re
+        if self._frozen:
+            raise VocabularyException('"' + self.word + '" is frozen')
         if alias is None:
             return False
         alias = alias.strip().lower()
@@ -92,15 +181,38 @@ class BaseWord(object):
         self.aliases.append(preg)
         return True
 
-    def get_valid_synsets(self, synset):
+    def freeze(self):
+        """
+        No more aliases from here on out. The aliases and synsets become
+        tuples, so they can be handed to anybody.
+        """
+
+        self.aliases = tuple(self.aliases)
+        self._refs = tuple(self._refs)
+        self._frozen = True
+
+    def same_as(self, other):
+        """
+        Is other the same base word, with the same production, synsets
+        and aliases?
+        """
+
+        return self.word == other.word and self.production == other.production and \
+            tuple(self._refs) == tuple(other._refs) and \
+            [a.pattern for a in self.aliases] == [a.pattern for a in other.aliases]
+
+    def get_valid_synsets(self, synset, ancestors = None):
         """
         Given a particular synset, see which of my own synsets (if any)
         are valid candidates. To be valid means that it is an ancestor
         (i.e. if I have a synset for "asia" and someone sends me the synset
         for "china", clearly asia is a hypernym, so that one is valid)
+
+        If an AncestorIndex is given it gets used instead of walking the
+        hypernym paths every time.
         """
 
-        if self.synsets is None or len(self.synsets) == 0 or synset is None:
+        if len(self._refs) == 0 or synset is None:
             return None
 
         valid_sets = []
@@ -109,17 +221,21 @@ class BaseWord(object):
                 # Don't compare non-nouns to nouns
                 continue
 
-            # Walk the hypernym paths, make sure I'm your ancestor
-            # (who's your daddy?)
-            paths = synset.hypernym_paths()
-            valid = False
-            for path in paths:
-                for p in path:
-                    if p == vsynset:
-                        valid = True
+            if ancestors is not None:
+                valid = ancestors.is_ancestor(vsynset, synset)
+            else:
+                # Walk the hypernym paths, make sure I'm your ancestor
+                # (who's your daddy?)
+                with _wordnet:
+                    paths = synset.hypernym_paths()
+                valid = False
+                for path in paths:
+                    for p in path:
+                        if p == vsynset:
+                            valid = True
+                            break
+                    if valid:
                         break
-                if valid:
-                    break
 
             # Are we at all related?
             if not valid:
@@ -134,6 +250,37 @@ class BaseWord(object):
         return valid_sets
 
 
+    def synset_refs(self):
+        """
+        Get the (pos, offset) of each of my synsets, without loading WordNet
+        """
+
+        return self._refs
+
+    def _get_synsets(self):
+        """
+        Get my WordNet synsets, loading WordNet if it hasn't been already
+        """
+
+        if self._synsets is None:
+            from nltk.corpus import wordnet as wn
+            with _wordnet:
+                synsets = tuple([wn._synset_from_pos_and_offset(pos, offset) for (pos, offset) in self._refs])
+            count('wordnet calls', len(self._refs))
+            self._synsets = synsets
+        return self._synsets
+
+    synsets = property(_get_synsets)
+
+    def __getstate__(self):
+        """
+        Pickle the synsets as (pos, offset), WordNet can find them again
+        """
+
+        state = self.__dict__.copy()
+        state['_synsets'] = None
+        return state
+
     def is_alias(self, word):
         """
         Determine if a given word is an alias for this word
@@ -149,25 +296,460 @@ class BaseWord(object):
                 return True
         return False
 
+class AncestorIndex(object):
+    """
+    Answers "is this vocabulary synset an ancestor of that synset?" in
+    constant time. Every synset used by the vocabulary gets a bit, and
+    every synset we've ever been asked about gets a mask with the bits
+    of all of its vocabulary ancestors (itself included) switched on.
+    Masks are built from the masks of the hypernyms, so each synset's
+    ancestry is only ever worked out once.
+
+    It also doubles as an inverted index from each vocabulary synset to
+    the base words that own it, so that finding candidates for an unknown
+    word only touches base words which are actually related to it.
+    """
+
+    def __init__(self, vocabulary):
+        """
+        Number the synsets of a vocabulary
+        """
+
+        self._bits = {}
+        self._synsets = {}
+        self._owners = {}
+        self._masks = {}
+        for baseword in vocabulary:
+            for synset in baseword.synsets:
+                if not self._bits.has_key(synset):
+                    bit = 1 << len(self._bits)
+                    self._bits[synset] = bit
+                    self._synsets[bit] = synset
+                    self._owners[synset] = []
+                if baseword not in self._owners[synset]:
+                    self._owners[synset].append(baseword)
+
+    def mask(self, synset):
+        """
+        Get the bitmask of vocabulary synsets which are ancestors of synset
+        """
+
+        if self._masks.has_key(synset):
+            return self._masks[synset]
+
+        with _wordnet:
+            mask = self._bits.get(synset, 0)
+            for hypernym in synset.hypernyms() + synset.instance_hypernyms():
+                mask |= self.mask(hypernym)
+
+        self._masks[synset] = mask
+        return mask
+
+    def is_ancestor(self, ancestor, synset):
+        """
+        Is ancestor (a vocabulary synset) on any hypernym path of synset?
+        """
+
+        bit = self._bits.get(ancestor)
+        if bit is None:
+            return False
+        return (self.mask(synset) & bit) != 0
+
+    def owners(self, synset):
+        """
+        Get the base words which have this exact synset
+        """
+
+        return self._owners.get(synset, ())
+
+    def related(self, synset):
+        """
+        Get (vocabulary synset, base words) for every vocabulary synset
+        which is an ancestor of synset (or synset itself)
+        """
+
+        related = []
+        mask = self.mask(synset)
+        while mask:
+            bit = mask & -mask
+            vsynset = self._synsets[bit]
+            related.append((vsynset, self._owners[vsynset]))
+            mask ^= bit
+        return related
+
+class Vocabulary(list):
+    """
+    A list of BaseWord objects which, once compiled, can answer "which
+    base word is this an alias for?" without walking the whole list.
+    Literal aliases live in a hash table, regex aliases are folded into
+    a single alternation which is only consulted when it can possibly
+    beat the literal answer.
+
+    Once frozen (config.configure() does that) it can't be changed any
+    more, which is what lets any number of threads search it at once.
+    """
+
+    # Anything containing one of these characters gets treated as a regex
+    _metachars = frozenset('.^$*+?{}[]\\|()')
+
+    # Punctuation which gets dropped off the end of a phrase before lookup
+    _trailing = ",.!\"'"
+
+    # Never changes once this is set, see freeze
+    _frozen = False
+
+    def __init__(self, basewords = None):
+        """
+        Create a new (uncompiled) vocabulary
+        """
+
+        list.__init__(self)
+        if basewords is not None:
+            self.extend(basewords)
+        self._literals = None
+        self._words = None
+        self._patterns = None
+        self._combined = None
+        self._phrases = None
+        self._regex_span = 1
+        self._span = 1
+        self._cache = None
+        self._ancestors = None
+
+    def compile(self):
+        """
+        Build the lookup tables. Must be called again if the list is
+        modified after the fact.
+        """
+
+        import re
+
+        if self._frozen:
+            raise VocabularyException('the vocabulary is frozen')
+
+        literals = {}
+        words = set()
+        patterns = []
+
+        for n, baseword in enumerate(self):
+            words.add(baseword.word)
+            if not literals.has_key(baseword.word):
+                literals[baseword.word] = []
+            if n not in literals[baseword.word]:
+                literals[baseword.word].append(n)
+
+            for preg in baseword.aliases:
+                # Strip off the '^...$' that add_alias slapped on
+                body = preg.pattern
+                if body.startswith('^') and body.endswith('$') and \
+                        len([c for c in body[1:-1] if c in self._metachars]) == 0:
+                    body = body[1:-1]
+                    if not literals.has_key(body):
+                        literals[body] = []
+                    if n not in literals[body]:
+                        literals[body].append(n)
+                else:
+                    patterns.append((n, preg))
+
+        combined = None
+        if len(patterns) > 0:
+            try:
+                combined = re.compile('|'.join(['(?:' + p.pattern + ')' for (n, p) in patterns]))
+            except (re.error, AssertionError, OverflowError):
+                # Too many groups for one regex (python < 3 caps it at 100),
+                # just fall back to trying them one by one.
+                combined = None
+
+        # A trie of every multi-word literal alias, one word per level. The
+        # None key marks the end of a phrase.
+        phrases = {}
+        span = 1
+        for key in literals.keys():
+            tokens = key.split(' ')
+            if len(tokens) < 2 or '' in tokens:
+                continue
+            node = phrases
+            for token in tokens:
+                if not node.has_key(token):
+                    node[token] = {}
+                node = node[token]
+            node[None] = True
+            span = max(span, len(tokens))
+
+        # There's no telling how many words a regex might eat, so assume it
+        # can't be more than one per space it contains (i.e. 'big[ -]boned')
+        regex_span = 1
+        for n, preg in patterns:
+            regex_span = max(regex_span, preg.pattern.count(' ') + preg.pattern.count('\\s') + 1)
+
+        self._literals = literals
+        self._words = words
+        self._patterns = patterns
+        self._combined = combined
+        self._phrases = phrases
+        self._regex_span = regex_span
+        self._span = max(span, regex_span)
+        self._ancestors = None
+
+    def freeze(self):
+        """
+        Compile the lookup tables (if that hasn't been done already) and
+        make this, and every base word in it, read-only from now on
+        """
+
+        if self._frozen:
+            return
+        if self._literals is None:
+            self.compile()
+        for baseword in self:
+            baseword.freeze()
+        self._frozen = True
+
+    def frozen(self):
+        """
+        Has freeze been called?
+        """
+
+        return self._frozen
+
+    def __getstate__(self):
+        """
+        Pickle the lookup tables, but not the cache or the ancestor index
+        """
+
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        state['_ancestors'] = None
+        return state
+
+    def find(self, word, exclude_self = False):
+        """
+        Find the first base word (in vocabulary order) for which the given
+        word is an alias, or None. If exclude_self is set then base words
+        which are spelled exactly like the given word are skipped over.
+        """
+
+        if self._literals is None:
+            self.compile()
+
+        exact = word
+        word = word.strip().lower()
+
+        best = None
+        for n in self._literals.get(word, ()):
+            if exclude_self and self[n].word == exact:
+                continue
+            best = n
+            break
+
+        if len(self._patterns) > 0 and (self._combined is None or self._combined.match(word)):
+            for n, preg in self._patterns:
+                if best is not None and n >= best:
+                    break
+                if exclude_self and self[n].word == exact:
+                    continue
+                if preg.match(word):
+                    best = n
+                    break
+
+        if best is None:
+            return None
+        return self[best]
+
+    def has_word(self, word):
+        """
+        Is this exact string the name of a base word?
+        """
+
+        if self._words is None:
+            self.compile()
+        return word in self._words
+
+    def fingerprint(self):
+        """
+        A hash of everything that affects how WordNet reduces a word: the
+        base words (in order), their synsets, and the version of WordNet
+        itself. The aliases don't count, they're always tried before
+        WordNet is, so adding or removing one never changes what WordNet
+        would have said.
+        """
+
+        import hashlib
+
+        sha = hashlib.sha1()
+        sha.update('wordnet ' + str(wordnet_version()) + '\n')
+        for baseword in self:
+            sha.update(repr((baseword.word, tuple(baseword.synset_refs()))) + '\n')
+        return sha.hexdigest()
+
+    def ancestors(self):
+        """
+        Get the AncestorIndex for this vocabulary's synsets
+        """
+
+        if self._ancestors is None:
+            with _wordnet:
+                if self._ancestors is None:
+                    self._ancestors = AncestorIndex(self)
+        return self._ancestors
+
+    def set_cache(self, cache):
+        """
+        Use a ReductionCache to remember what WordNet says about
+        unknown words. None turns it off. The cache isn't part of the
+        configuration, so this is fine even when frozen.
+        """
+
+        self._cache = cache
+
+    def cache(self):
+        """
+        Get the ReductionCache, if any
+        """
+
+        return self._cache
+
+    def _match(self, window):
+        """
+        Find the longest alias at the very start of a list of words.
+        Returns a (size, baseword) tuple, or (0, None) if there isn't one.
+        """
+
+        # Walk the phrase trie to see which lengths are even worth trying
+        sizes = set(range(1, min(self._regex_span, len(window)) + 1))
+        node = self._phrases
+        for n, part in enumerate(window):
+            part = part.lower()
+            last = part.rstrip(self._trailing)
+            if len(last) == 0:
+                # Trailing junk like "receding hairline ," gets swallowed
+                if n > 0:
+                    sizes.add(n + 1)
+            elif node.has_key(last) and node[last].has_key(None):
+                sizes.add(n + 1)
+            node = node.get(part)
+            if node is None:
+                break
+
+        sizes = list(sizes)
+        sizes.sort()
+        sizes.reverse()
+        for size in sizes:
+            pre = (' '.join(window[:size])).lower().rstrip(self._trailing)
+            vword = self.find(pre, True)
+            if vword is not None:
+                return (size, vword)
+        return (0, None)
+
+    def rewrite(self, parts):
+        """
+        Replace every alias in a list of words with its base word. Same as
+        replacing the longest alias anywhere in the phrase (the rightmost
+        one if there's a tie) over and over until there aren't any left,
+        except that only the words around a replacement ever get looked at
+        again. That's also how a replacement that forms a new alias with
+        the words around it (i.e. "black with white" -> "black and white"
+        -> "b&w") gets picked up.
+        """
+
+        import heapq
+
+        if self._phrases is None:
+            self.compile()
+
+        # A linked list of the words. Every position has a version, which
+        # goes up whenever anything in the window starting there changes,
+        # so that matches found before then can be told apart.
+        words = list(parts)
+        after = range(1, len(words)) + [None]
+        before = [None] + range(0, len(words) - 1)
+        versions = [0] * len(words)
+        found = []   # (-size, -position, version, baseword)
+
+        def look(n):
+            window = []
+            m = n
+            while m is not None and len(window) < self._span:
+                window.append(words[m])
+                m = after[m]
+            size, vword = self._match(window)
+            if vword is not None:
+                heapq.heappush(found, (-size, -n, versions[n], vword))
+
+        for n in xrange(len(words)):
+            look(n)
+
+        while len(found) > 0:
+            size, n, version, vword = heapq.heappop(found)
+            size = -size
+            n = -n
+            if version != versions[n]:
+                continue
+
+            # The replacement takes the first word's place
+            m = after[n]
+            for k in xrange(size - 1):
+                versions[m] += 1
+                m = after[m]
+            words[n] = vword.word
+            after[n] = m
+            if m is not None:
+                before[m] = n
+
+            # Everything with a window reaching this far has to look again
+            m = n
+            for k in xrange(self._span):
+                if m is None:
+                    break
+                versions[m] += 1
+                look(m)
+                m = before[m]
+
+        done = []
+        n = 0
+        if len(words) == 0:
+            n = None
+        while n is not None:
+            done.append(words[n])
+            n = after[n]
+        return done
+
+def _frozen_guard(name):
+    """
+    Wrap one of list's methods so it refuses to touch a frozen Vocabulary
+    """
+
+    method = getattr(list, name)
+    def guarded(self, *args):
+        if self._frozen:
+            raise VocabularyException('the vocabulary is frozen')
+        return method(self, *args)
+    guarded.__name__ = name
+    guarded.__doc__ = method.__doc__
+    return guarded
+
+for _name in ('append', 'extend', 'insert', 'remove', 'pop', 'sort', 'reverse', '__setitem__', '__delitem__',
+              '__setslice__', '__delslice__', '__iadd__', '__imul__'):
+    setattr(Vocabulary, _name, _frozen_guard(_name))
+del _name
+
 class Word(object):
     """
     Represents a single word, and anything about it
     """
     
-    def __init__(self, word, vocabulary, onlyDefine = False):
+    def __init__(self, word, vocabulary, onlyDefine = False, deadline = None):
         """
-        Initialize this beeyatch
+        Initialize this beeyatch. If a deadline.Deadline is given, WordNet
+        only gets until then (after that it's a TimeoutException).
         """
-        self._process(word, vocabulary, onlyDefine)
+        self._process(word, vocabulary, onlyDefine, deadline)
 
-    def _process(self, word, vocabulary, onlyDefine):
+    def _process(self, word, vocabulary, onlyDefine, deadline):
         """
         Reduce a word to something we can more easily process later
         """
 
-        import nltk
-        from nltk.corpus import wordnet as wn
-
         # Normalize the word
         self._original = word
         self._normalized = word.strip().lower()
@@ -176,70 +758,111 @@ class Word(object):
             raise NonWordException(word)
 
         # Is it a simple word (i.e. just a root word or an alias)?
+        cache = None
         if not onlyDefine:
-            for baseword in vocabulary:
-                if baseword.is_alias(self._normalized):
-                    self._reduced = baseword.word
-                    return
+            baseword = vocabulary.find(self._normalized)
+            if baseword is not None:
+                self._reduced = baseword.word
+                return
+
+            # Maybe we've already been through all this before
+            cache = vocabulary.cache()
+            if cache is not None:
+                entry = cache.get(self._normalized)
+                if entry is not None:
+                    if entry[0] == cache.REDUCED:
+                        self._reduced = entry[1]
+                        return
+                    raise UnknownWordException(word)
 
         # Damn, looks like we have some work to do
-        self._pos_forms = []
-        self._definitions = {}
-        for pos in (wn.NOUN, wn.VERB, wn.ADJ, wn.ADV):
-            # Find a possible base form for the given form, with the given
-            # part of speech, by checking WordNet's list of exceptional forms,
-            # and by recursively stripping affixes for this part of speech
-            # until a form in WordNet is found.
-
-            form = wn.morphy(self._normalized, pos)
-            if form is not None:
-                synsets = wn.synsets(form, pos)
-                for synset in synsets:
-                    forms = []
-                    for lemma in synset.lemmas:
-                         name = lemma.name.replace(' ', '_').lower()
-                         if name == self._normalized:
-                             forms.append(lemma)
-                             self._definitions[lemma.key] = lemma.synset.definition
-
-                    if len(forms) == 0:
-                        continue
-                    self._pos_forms.append((synset, forms[0].key))
-
-        # Sometimes we just want the definitions
-        if onlyDefine:
-            return
-
-        # The part-of-speech tagger has failed
-        if len(self._pos_forms) == 0:
-            raise UnknownWordException(word)
-
-        # OK, now we have a list of the possible synsets for this word, let's find out if
-        # we have a word that is close.
-        candidates = []
-
-        for baseword in vocabulary:
-            if baseword.synsets is None or len(baseword.synsets) == 0:
-                continue
+        doing = None
+        if deadline is not None:
+            doing = 'reducing "' + self._normalized + '"'
+            deadline.check(doing)
+        from nltk.corpus import wordnet as wn
 
+        # WordNet is one thread at a time (see _wordnet)
+        with _wordnet:
+            self._pos_forms = []
+            self._definitions = {}
+            for pos in (wn.NOUN, wn.VERB, wn.ADJ, wn.ADV):
+                # Find a possible base form for the given form, with the given
+                # part of speech, by checking WordNet's list of exceptional forms,
+                # and by recursively stripping affixes for this part of speech
+                # until a form in WordNet is found.
+
+                if deadline is not None:
+                    deadline.check(doing)
+                form = wn.morphy(self._normalized, pos)
+                count('wordnet calls')
+                if form is not None:
+                    synsets = wn.synsets(form, pos)
+                    count('wordnet calls')
+                    for synset in synsets:
+                        forms = []
+                        for lemma in synset.lemmas:
+                             name = lemma.name.replace(' ', '_').lower()
+                             if name == self._normalized:
+                                 forms.append(lemma)
+                                 self._definitions[lemma.key] = lemma.synset.definition
+
+                        if len(forms) == 0:
+                            continue
+                        self._pos_forms.append((synset, forms[0].key))
+
+            # Sometimes we just want the definitions
+            if onlyDefine:
+                return
+
+            # The part-of-speech tagger has failed
+            if len(self._pos_forms) == 0:
+                if cache is not None:
+                    cache.put(self._normalized, cache.UNKNOWN)
+                raise UnknownWordException(word)
+
+            # OK, now we have a list of the possible synsets for this word, let's find out if
+            # we have a word that is close. The best candidate is the biggest (score, baseword)
+            # tuple, which is exactly what sorting the whole list and reversing it used to give.
+            ancestors = vocabulary.ancestors()
+            best = None
+
+            # If one of the synsets is one of our own the score is a perfect 1.0, nothing
+            # else can beat that so don't bother measuring distances.
             for synset, key in self._pos_forms:
-                bsynsets = baseword.get_valid_synsets(synset)
-                if bsynsets is None:
-                    continue
-
-                # OK, we're related, so let's find out our distance to each other
-                for bsynset in bsynsets:
-                    score = wn.path_similarity(synset, bsynset)
-                    candidates.append((score, baseword))
-
-        # Determine the closest match
-        candidates.sort()
-        candidates.reverse()
-
-        if len(candidates) == 0:
+                if deadline is not None:
+                    deadline.check(doing)
+                for baseword in ancestors.owners(synset):
+                    candidate = (wn.path_similarity(synset, synset), baseword)
+                    count('wordnet calls')
+                    if best is None or candidate > best:
+                        best = candidate
+
+            if best is None:
+                for synset, key in self._pos_forms:
+                    for bsynset, basewords in ancestors.related(synset):
+                        if bsynset.pos != synset.pos:
+                            # Don't compare non-nouns to nouns
+                            continue
+
+                        # OK, we're related, so let's find out our distance to each other
+                        if deadline is not None:
+                            deadline.check(doing)
+                        score = wn.path_similarity(synset, bsynset)
+                        count('wordnet calls')
+                        for baseword in basewords:
+                            candidate = (score, baseword)
+                            if best is None or candidate > best:
+                                best = candidate
+
+        if best is None:
+            if cache is not None:
+                cache.put(self._normalized, cache.UNKNOWN)
             raise UnknownWordException(word)
 
-        self._reduced = candidates[0][1].word
+        self._reduced = best[1].word
+        if cache is not None:
+            cache.put(self._normalized, cache.REDUCED, self._reduced)
 
     def __str__(self):
         """